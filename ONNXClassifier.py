@@ -1,35 +1,125 @@
-import onnxruntime
+import threading
 import numpy as np
 from PIL import Image
+from preprocess import Preprocessor
+from ort_session import get_session
+import metrics
 
 class ONNXClassifier:
-    def __init__(self, onnx_model_path, class_mapping=None):
-        self.session = onnxruntime.InferenceSession(onnx_model_path)
-        self.input_name = self.session.get_inputs()[0].name
+    def __init__(self, onnx_model_path, class_mapping=None, session_config=None):
+        self.model_path = onnx_model_path
+        self.session_config = session_config or {}
         self.class_mapping = class_mapping
+        self.preprocessor = Preprocessor()
+        # 預處理使用共用的輸入緩衝區，預處理與推論需在同一把鎖內完成
+        self._lock = threading.Lock()
+        self._use_session(get_session(onnx_model_path, **self.session_config))
+
+    def _use_session(self, session):
+        # 相同模型與設定共用同一個 session（設定見 ort_session.get_session）
+        self.session = session
+        self.input_name = self.session.get_inputs()[0].name
+        # 可載入 FP32、INT8 或 FP16 版本；只有未保留 float32 輸入的 FP16 模型需要轉型
+        self.input_dtype = np.float16 if self.session.get_inputs()[0].type == 'tensor(float16)' else np.float32
+        # 舊版匯出的模型 batch 維度固定為 1，只能逐張推論
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) else None
+
+    def reload(self):
+        """Pick up a new model written to the same path (e.g. by finetune.py); returns True if it changed"""
+        session = get_session(self.model_path, **self.session_config)
+        if session is self.session:
+            return False
+        with self._lock:
+            self._use_session(session)
+        print(f"Reloaded model from {self.model_path}")
+        return True
 
     def preprocess_image(self, image_path):
-        # 圖像預處理：調整大小、轉換為 numpy
-        image = Image.open(image_path).convert("RGB").resize((224, 224))
-        image_np = np.array(image).astype('float32') / 255.0  # 將類型設為 float32
-        # 正規化數據
-        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)  # 確保均值和標準差類型一致
-        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-        image_np = (image_np - mean) / std
-        # HWC -> CHW 格式調整
-        image_np = np.transpose(image_np, (2, 0, 1))
-        # 增加一個 batch 維度
-        return np.expand_dims(image_np, axis=0)
+        # 圖像預處理：PIL 解碼為 RGB 後交給共用的預處理器
+        image = np.asarray(Image.open(image_path).convert("RGB"))
+        return self.preprocessor.preprocess(image, bgr=False)
 
-    def predict(self, image_path):
-        # 預測結果
-        image_tensor = self.preprocess_image(image_path)
-        outputs = self.session.run(None, {self.input_name: image_tensor})
-        predicted_class = np.argmax(outputs[0], axis=1)[0]
+    def preprocess_frame(self, frame):
+        # OpenCV 的 BGR 畫面直接預處理，不經過 JPEG 存檔與 PIL 解碼
+        with metrics.span("preprocess"):
+            return self.preprocessor.preprocess(frame)
+
+    def label(self, predicted_class):
+        """Map a class index to its label"""
         if self.class_mapping:
             return self.class_mapping.get(predicted_class, f"Class {predicted_class}")
         return f"Class {predicted_class}"
 
+    def _logits(self, image_tensor):
+        if self.input_dtype is not np.float32:
+            image_tensor = image_tensor.astype(self.input_dtype)
+        with metrics.span("session_run"):
+            return self.session.run(None, {self.input_name: image_tensor})[0]
+
+    def _run(self, image_tensor):
+        return [self.label(int(c)) for c in np.argmax(self._logits(image_tensor), axis=1)]
+
+    def predict(self, image_path):
+        # 預測結果
+        with self._lock:
+            return self._run(self.preprocess_image(image_path))[0]
+
+    def predict_frame(self, frame):
+        """Classify a BGR frame straight from USBCamera.get_current_frame()"""
+        with self._lock:
+            return self._run(self.preprocess_frame(frame))[0]
+
+    @staticmethod
+    def _softmax(logits):
+        logits = np.concatenate(logits).astype(np.float32)
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def predict_scores(self, frames):
+        """Return softmax class probabilities, shape (len(frames), num_classes), for a list of BGR frames"""
+        with self._lock:
+            if self.max_batch is None:
+                with metrics.span("preprocess"):
+                    image_tensor = self.preprocessor(frames)
+                logits = [self._logits(image_tensor)]
+            else:
+                logits = [self._logits(self.preprocess_frame(frame)) for frame in frames]
+        return self._softmax(logits)
+
+    def scores_from_tensor(self, image_tensor):
+        """Return softmax probabilities for an already preprocessed (N, 3, 224, 224) float32 tensor"""
+        if self.max_batch is None:
+            logits = [self._logits(image_tensor)]
+        else:
+            logits = [self._logits(image_tensor[i:i + 1]) for i in range(len(image_tensor))]
+        return self._softmax(logits)
+
+    def classify_frame(self, frame):
+        """Return (class_id, confidence) for one BGR frame"""
+        scores = self.predict_scores([frame])[0]
+        class_id = int(np.argmax(scores))
+        return class_id, float(scores[class_id])
+
+    def class_id(self, label):
+        """Map a label back to its class index (None if unknown)"""
+        for class_id, name in (self.class_mapping or {}).items():
+            if name == label:
+                return class_id
+        return None
+
+    def predict_frames(self, frames):
+        """Classify a list of BGR frames, in one session.run when the model has a dynamic batch axis"""
+        with self._lock:
+            if self.max_batch is None:
+                return self._run(self.preprocessor(frames))
+            labels = []
+            for frame in frames:
+                labels.extend(self._run(self.preprocess_frame(frame)))
+            return labels
+
 if __name__ == "__main__":
     onnx_model_path = "model.onnx"
     image_path = "image1.jpg"
@@ -1,25 +1,46 @@
 import cv2
 import threading
 import time
-from queue import Queue
+from queue import Queue, Empty
+from frame_ring import FrameRing, FrameLease
+import metrics
 
 class USBCamera:
-    def __init__(self, camera_index=2):
-        """Initialize the camera with a specified camera index"""
+    def __init__(self, camera_index=2, fps=30, ring_size=4, max_ring_size=None):
+        """Initialize the camera with a specified camera index, target frame rate and frame ring size.
+
+        The ring grows up to max_ring_size slots (default twice ring_size) while frames are leased; beyond that
+        new frames are dropped.
+        """
         self.camera_index = camera_index
+        self.fps = fps
+        self.running = False
+        self.frame = None  # Read-only view of the latest frame
+        self.frame_seq = 0  # Increases by one for every published frame
+        self.ring = FrameRing(slots=ring_size, shape=(480, 640, 3), max_slots=max_ring_size)
+        self.frame_lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.frame_lock)
+        self.subscribers = []
+        self.save_queue = Queue()
+        self._open_device()
+
+    def _open_device(self):
+        """Open the capture device; subclasses replace this and _read_frame/_close_device for other sources"""
         self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)  # Use DirectShow backend
         # Set camera properties
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
-        self.running = False
-        self.frame = None
-        self.frame_lock = threading.Lock()
-        self.save_queue = Queue()
-        
+        self.cap.set(cv2.CAP_PROP_FPS, self.fps)
         if not self.cap.isOpened():
             raise Exception(f"Failed to open USB camera (index {self.camera_index})")
 
+    def _read_frame(self, buffer):
+        """Read the next frame into buffer; returns (ok, frame) like cv2.VideoCapture.read"""
+        return self.cap.read(buffer)
+
+    def _close_device(self):
+        self.cap.release()
+
     def start(self):
         """Start the camera and begin multi-threaded operation"""
         if not self.running:
@@ -36,8 +57,13 @@ class USBCamera:
         """Thread to continuously capture frames"""
         max_retries = 10
         retry_count = 0
+        frame_interval = 1.0 / self.fps if self.fps else 0.0
+        next_frame_time = time.monotonic()
         while self.running:
-            ret, frame = self.cap.read()
+            # Decode straight into a free ring slot instead of a fresh array
+            index, buffer = self.ring.acquire_write()
+            with metrics.span("capture"):
+                ret, frame = self._read_frame(buffer)
             if not ret:
                 print("Failed to capture image, retrying...")
                 retry_count += 1
@@ -49,30 +75,64 @@ class USBCamera:
                 continue
             
             retry_count = 0
-            with self.frame_lock:
-                self.frame = frame.copy()
-            time.sleep(0.1)  # Reduced to ~10 FPS
+            # index 為 None 表示 ring 已滿：畫面讀進暫存區後直接丟棄，不發布
+            if index is not None:
+                with self.frame_ready:
+                    self.frame_seq += 1
+                    seq = self.frame_seq
+                    self.ring.publish(index, seq, frame)
+                    self.frame = frame = self.ring.view(index)
+                    self.frame_ready.notify_all()
+                for callback in list(self.subscribers):
+                    callback(seq, frame)
+
+            # cap.read() already blocks at the device rate; only throttle when a lower fps is requested
+            next_frame_time += frame_interval
+            delay = next_frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame_time = time.monotonic()
+        with self.frame_ready:
+            self.frame_ready.notify_all()
 
     def _save_loop(self):
         """Thread to handle save requests"""
         while self.running:
-            if not self.save_queue.empty():
-                filename = self.save_queue.get()
+            try:
+                request = self.save_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if request is None:  # Sentinel from stop()
+                break
+            filename, frame = request
+            if frame is None:
                 self.save_current_frame(filename)
-            time.sleep(0.01)
+            elif isinstance(frame, FrameLease):
+                with frame, metrics.span("save"):
+                    cv2.imwrite(filename, frame.frame)
+                print(f"Image saved as {filename}")
+            else:
+                with metrics.span("save"):
+                    cv2.imwrite(filename, frame)
+                print(f"Image saved as {filename}")
 
     def save_current_frame(self, filename='capture.jpg'):
         """Save the current frame to a specified file"""
-        with self.frame_lock:
-            if self.frame is not None:
-                cv2.imwrite(filename, self.frame)
-                print(f"Image saved as {filename}")
-            else:
-                print("No frame available to save")
+        lease = self.ring.lease_latest()
+        if lease is None:
+            print("No frame available to save")
+            return
+        with lease:
+            cv2.imwrite(filename, lease.frame)
+        print(f"Image saved as {filename}")
+
+    def request_save(self, filename='capture.jpg', frame=None):
+        """Request to save a frame or FrameLease from an external call (the current frame if none is given).
 
-    def request_save(self, filename='capture.jpg'):
-        """Request to save the current frame from an external call"""
-        self.save_queue.put(filename)
+        A lease passed here is released by the save thread once the file is written.
+        """
+        self.save_queue.put((filename, frame))
 
     def detect_and_draw_objects(self, frame):
         """Detect objects in the frame and draw bounding boxes"""
@@ -85,18 +145,55 @@ class USBCamera:
         return frame
 
     def get_current_frame(self):
-        """Get the current frame with lock protection"""
-        with self.frame_lock:
-            if self.frame is not None:
-                return self.frame.copy()
-        return None
+        """Get a private, writable copy of the current frame"""
+        lease = self.ring.lease_latest()
+        if lease is None:
+            return None
+        with lease:
+            return lease.frame.copy()
+
+    def lease_frame(self, last_seq=None, timeout=None):
+        """Lease the latest frame without copying; with last_seq, wait for a newer one first.
+
+        Returns a FrameLease (read-only .frame, .seq) that must be released, or None on timeout.
+        """
+        if last_seq is not None:
+            with self.frame_ready:
+                if not self.frame_ready.wait_for(lambda: self.frame_seq > last_seq or not self.running, timeout):
+                    return None
+                if self.frame_seq <= last_seq:
+                    return None
+        return self.ring.lease_latest()
+
+    def wait_for_frame(self, last_seq=0, timeout=None):
+        """Block until a frame newer than last_seq is published; returns (seq, frame copy) or (last_seq, None) on timeout"""
+        lease = self.lease_frame(last_seq, timeout)
+        if lease is None:
+            return last_seq, None
+        with lease:
+            return lease.seq, lease.frame.copy()
+
+    def subscribe(self, callback):
+        """Call callback(seq, frame) from the capture thread for every new frame.
+
+        The frame is a read-only view that is only guaranteed valid during the call.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a callback registered with subscribe"""
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
 
     def stop(self):
         """Stop the camera and release resources"""
         self.running = False
+        self.save_queue.put(None)
+        with self.frame_ready:
+            self.frame_ready.notify_all()
         self.capture_thread.join()
         self.save_thread.join()
-        self.cap.release()
+        self._close_device()
         print("Camera stopped")
 
 if __name__ == "__main__":
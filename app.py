@@ -1,84 +1,74 @@
 from flask import Flask, render_template, Response, jsonify, request
 from flask_socketio import SocketIO, emit
+import itertools
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
-import cv2
-import socket
-import os
 from USBCamera import USBCamera
-from ONNXClassifier import ONNXClassifier
+from inference_pool import InferencePool
+from mjpeg import MJPEGBroadcaster
+from voting import TemporalVoter
+import protocol
+from sorter_client import SorterConnection
+from phash_cache import CachedClassifier
+from archive import CaptureArchive
+import metrics
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'  # 用於 WebSocket 的密鑰
 socketio = SocketIO(app, cors_allowed_origins="*")
+metrics.enable()  # 由 /metrics 提供各階段延遲直方圖
 
 # 初始化相機和模型
 camera = USBCamera(camera_index=2)
 class_mapping = {0: "bottle", 1: "glass_bottle", 2: "iron", 3: "paper"}
-classifier = ONNXClassifier("model.onnx", class_mapping)
+# 推論在獨立的 worker 行程執行（畫面經共用記憶體傳遞），不與 Flask、MJPEG 串流爭搶 GIL
+INFERENCE_WORKERS = 2
+classifier = InferencePool("model.onnx", class_mapping, workers=INFERENCE_WORKERS)
+RESULT_CACHE = False  # 畫面與上次完全相同時（重複按下）直接回傳上次結果；背景相同的不同物品可能誤用，預設關閉
+cached_classifier = CachedClassifier(classifier) if RESULT_CACHE else classifier
+voter = TemporalVoter(classifier)  # 多幀投票，TEMPORAL_VOTING 開啟時使用
+broadcaster = MJPEGBroadcaster(camera, quality=80)  # size=(320, 240) 可降低編碼與頻寬成本
 latest_prediction = {"prediction": "None yet"}  # 儲存最新的預測結果
-latest_captured_image = None  # 儲存最新的擷取影像
 frame_lock = threading.Lock()  # 用於保護共享資源
+# /capture 立即回傳 job ID，預測與存檔在背景執行，結果經 WebSocket 推送
+capture_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="capture")
+capture_jobs = itertools.count(1)
 
 # Socket 客戶端配置
 HOST = "192.168.12.98"
 PORT = 65432
-socket_client = None
-socket_thread = None
-socket_running = True
 
-# 確保 static/captures 資料夾存在
+# 擷取影像存檔位置（需在 static 底下，前端才能直接載入）
 CAPTURE_DIR = "static/captures"
-if not os.path.exists(CAPTURE_DIR):
-    os.makedirs(CAPTURE_DIR)
-
-def connect_to_socket_server():
-    """連接到 socket server 並處理接收訊息"""
-    global socket_client, socket_running
-    while socket_running:
-        try:
-            socket_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            socket_client.connect((HOST, PORT))
-            print(f"Connected to socket server at {HOST}:{PORT}")
-            
-            # 持續接收 server 的訊息
-            while socket_running:
-                data = socket_client.recv(1024)
-                if not data:
-                    print("Socket server disconnected")
-                    break
-                message = data.decode('utf-8')
-                print(f"Received from socket server: {message}")
-                # 將接收到的訊息發送到前端
-                socketio.emit('server_message', {'message': message}, namespace='/')
-        except Exception as e:
-            print(f"Socket error: {e}")
-            socket_client.close()
-            time.sleep(5)  # 斷線後等待 5 秒再重連
-        finally:
-            if socket_client:
-                socket_client.close()
-
-def send_to_socket_server(message):
-    """發送訊息到 socket server"""
-    try:
-        socket_client.sendall(message.encode('utf-8'))
-        print(f"Sent to socket server: {message}")
-    except Exception as e:
-        print(f"Error sending to socket server: {e}")
+SAVE_CAPTURES = True  # 是否在送出預測後於背景存檔
+TEMPORAL_VOTING = False  # 是否以連續多幀投票決定預測結果
+# 背景編碼存檔，依日期分資料夾並以 SQLite 記錄預測結果；超過 2 GiB 或 30 天的舊檔自動刪除
+# 索引放在 static 之外，網頁只能取得影像與縮圖，取不到預測紀錄
+archive = CaptureArchive(CAPTURE_DIR, max_bytes=2 * 1024 ** 3, max_age_days=30, thumbnail_size=(320, 240),
+                         index_path="data/captures.sqlite3")
+
+def on_server_message(message):
+    """將 socket server 的回覆轉發到前端"""
+    text = protocol.describe(message)
+    print(f"Received from socket server: {text}")
+    socketio.emit('server_message', {'message': text}, namespace='/')
+
+# 持續連線並自動重連；斷線期間的分類結果暫存在佇列中
+sorter = SorterConnection(HOST, PORT, on_message=on_server_message)
+
+def send_to_socket_server(class_id, confidence):
+    """發送分類結果到 socket server（不會阻塞），回傳 request ID"""
+    request_id = sorter.send_classification(class_id, confidence)
+    print(f"Queued for socket server: #{request_id} class {class_id}")
+    return request_id
 
 def generate_frames():
-    """生成即時畫面串流"""
+    """生成即時畫面串流（所有觀看者共用同一次 JPEG 編碼）"""
     camera.start()
-    while True:
-        frame = camera.get_current_frame()
-        if frame is not None:
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.1)  # 控制幀率
+    broadcaster.start()
+    return broadcaster.stream()
 
 @app.route('/video_feed')
 def video_feed():
@@ -86,32 +76,56 @@ def video_feed():
 
 @app.route('/capture', methods=['POST'])
 def capture():
-    """擷取當前畫面並進行預測"""
-    global latest_prediction, latest_captured_image
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"{CAPTURE_DIR}/capture_{timestamp}.jpg"
-    
-    # 儲存當前畫面
-    camera.request_save(filename)
-    time.sleep(0.5)  # 等待圖片保存完成
-    
-    # 使用模型進行預測
-    prediction = classifier.predict(filename)
-    
-    # 更新全局變數
-    with frame_lock:
-        latest_prediction = {"prediction": prediction}
-        latest_captured_image = filename
-    
-    # 發送到 socket server
-    keys = [key for key, value in class_mapping.items() if value == prediction] 
-    send_to_socket_server(f"{keys[0]+1}")
-    print("test_socket_out:",keys[0]+1)
-    
-    # 通過 WebSocket 發送到前端
-    socketio.emit('prediction_update', latest_prediction, namespace='/')
-    
-    return jsonify(latest_prediction)
+    """擷取當前畫面，立即回傳 job ID；預測結果與縮圖之後經 WebSocket 推送"""
+    lease = camera.lease_frame()
+    if lease is None:
+        return jsonify({"error": "No frame available"}), 503
+    job_id = next(capture_jobs)
+    capture_executor.submit(run_capture, job_id, lease)
+    return jsonify({"job_id": job_id}), 202
+
+def run_capture(job_id, lease):
+    """背景執行：預測、送出結果並存檔；任何失敗都以 capture_error 通知前端"""
+    global latest_prediction
+    item_id = metrics.new_item_id()
+    start = time.perf_counter()
+    try:
+        # 直接以相機緩衝區中的畫面進行預測
+        with metrics.span("classify", item_id):
+            if TEMPORAL_VOTING:
+                prediction, confidence, frames_used = voter.classify(camera, lease)
+                class_id = classifier.class_id(prediction)
+            else:
+                class_id, confidence = cached_classifier.classify_frame(lease.frame)
+                prediction = classifier.label(class_id)
+        
+        # 發送到 socket server
+        request_id = send_to_socket_server(class_id, confidence)
+        metrics.annotate(item_id, request_id=request_id, label=prediction)
+        
+        # 更新全局變數並通過 WebSocket 發送到前端
+        result = {"job_id": job_id, "prediction": prediction, "confidence": round(confidence, 4)}
+        with frame_lock:
+            latest_prediction = result
+        socketio.emit('prediction_update', result, namespace='/')
+        
+        # 預測送出後再於背景存檔，寫完後推送影像與縮圖網址
+        if SAVE_CAPTURES:
+            # archive 接手 lease（編碼完成或略過時釋放）；存檔跟不上時會略過這張，不會拖慢擷取
+            owned_lease, lease = lease, None
+            archive.submit(owned_lease, label=prediction, class_id=class_id, confidence=confidence,
+                           latency=time.perf_counter() - start, request_id=request_id,
+                           on_saved=lambda record: socketio.emit('capture_saved', {
+                               "job_id": job_id,
+                               "image_url": f"/{CAPTURE_DIR}/{record['path']}",
+                               "thumbnail_url": f"/{CAPTURE_DIR}/{record['thumbnail']}",
+                           }, namespace='/'))
+    except Exception as e:
+        print(f"Capture job {job_id} failed: {e}")
+        socketio.emit('capture_error', {"job_id": job_id, "error": str(e)}, namespace='/')
+    finally:
+        if lease is not None:
+            lease.release()
 
 @app.route('/get_prediction')
 def get_prediction():
@@ -119,11 +133,15 @@ def get_prediction():
     with frame_lock:
         return jsonify(latest_prediction)
 
-@app.route('/get_captured_image')
-def get_captured_image():
-    """返回最新擷取的影像路徑"""
-    with frame_lock:
-        return jsonify({"image_path": latest_captured_image if latest_captured_image else ""})
+@app.route('/reload_model', methods=['POST'])
+def reload_model():
+    """重新載入 model.onnx（例如 finetune.py 匯出新模型後），不需重啟服務"""
+    return jsonify({"reloaded": cached_classifier.reload()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 格式的延遲直方圖與計數"""
+    return Response(metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -131,18 +149,19 @@ def index():
 
 def shutdown():
     """關閉應用時清理資源"""
-    global socket_running
-    socket_running = False
+    broadcaster.stop()
+    capture_executor.shutdown(wait=True)
     camera.stop()
-    if socket_client:
-        socket_client.close()
+    archive.stop()
+    sorter.stop()
+    classifier.stop()
     print("Application shutting down...")
 
 if __name__ == "__main__":
-    # 啟動 socket 客戶端線程
-    socket_thread = threading.Thread(target=connect_to_socket_server)
-    socket_thread.daemon = True
-    socket_thread.start()
+    # 啟動推論 worker、socket 客戶端與存檔執行緒
+    classifier.start()
+    sorter.start()
+    archive.start()
     
     try:
         socketio.run(app, debug=True, host='0.0.0.0', port=5000, use_reloader=False)
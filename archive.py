@@ -0,0 +1,282 @@
+"""Background capture archive with a SQLite index and size/age retention.
+
+submit() hands a frame (or FrameLease) to a small encode thread pool and returns
+at once; cv2.imencode releases the GIL, so JPEG encoding runs in parallel with
+capture and inference. A single writer thread stores the encoded images in
+daily directories and records each one, in batched transactions, in an SQLite
+index together with its prediction, confidence and latency:
+
+    static/captures/
+        20240518/
+            142301_517_000042.jpg
+    data/
+        captures-1a2b3c4d.sqlite3
+
+The index lives outside root, so serving root (e.g. under Flask's static
+folder) exposes only the images, not the prediction records.
+
+File names carry milliseconds and a per-process sequence number, so two
+captures in the same second never overwrite each other. With thumbnail_size a
+small preview is stored next to each image (see thumbnail_path), and a
+submit() callback reports when both files are on disk. The writer also keeps
+the archive under max_bytes and deletes entries older than max_age_days, oldest
+first, so a long-running unit does not fill the SD card. When the encoders fall
+behind, new captures are dropped (and counted) instead of stalling the caller.
+"""
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+
+import cv2
+
+import metrics
+from frame_ring import FrameLease
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    captured_at REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    label TEXT,
+    class_id INTEGER,
+    confidence REAL,
+    latency_ms REAL,
+    request_id INTEGER,
+    lane TEXT
+);
+CREATE INDEX IF NOT EXISTS captures_captured_at ON captures (captured_at);
+"""
+COLUMNS = ("path", "captured_at", "bytes", "label", "class_id", "confidence", "latency_ms", "request_id", "lane")
+DEFAULT_INDEX_DIR = "data"
+
+def default_index_path(root, index_dir=DEFAULT_INDEX_DIR):
+    """Index file for an archive root, named after the root so several archives never share one"""
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(index_dir, f"{os.path.basename(os.path.normpath(root))}-{key}.sqlite3")
+
+def thumbnail_path(path):
+    """Path of the preview stored next to an archived image"""
+    return path[:-len(".jpg")] + ".thumb.jpg"
+
+class CaptureArchive:
+    def __init__(self, root="static/captures", max_bytes=2 * 1024 ** 3, max_age_days=30, quality=85,
+                 workers=2, max_pending=8, prune_interval=60.0, batch_size=32, thumbnail_size=None, index_path=None):
+        """Archive under root keeping at most max_bytes of images younger than max_age_days (None disables a limit).
+
+        index_path defaults to default_index_path(root); it must not be inside a publicly served directory.
+        """
+        self.root = root
+        self.index_path = index_path or default_index_path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.thumbnail_size = thumbnail_size  # (width, height) of the preview, None for no previews
+        self.workers = workers
+        self.max_pending = max_pending
+        self.prune_interval = prune_interval
+        self.batch_size = batch_size
+        self.write_queue = Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.sequence = itertools.count(1)
+        self.counts = {"archived": 0, "dropped": 0, "pruned": 0}
+        self.total_bytes = 0
+        self.running = False
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        db = self._connect()
+        with db:
+            db.executescript(SCHEMA)
+        db.close()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.encoder = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="archive-encode")
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def submit(self, frame, label=None, class_id=None, confidence=None, latency=None, request_id=None, lane=None,
+               on_saved=None):
+        """Queue a BGR frame or FrameLease for archiving; returns its path relative to root, or None if dropped.
+
+        A lease is released once the frame is encoded. latency is in seconds.
+        on_saved(record), if given, is called from the writer thread once the files are written.
+        """
+        with self.lock:
+            if not self.running or self.pending >= self.max_pending:
+                self.counts["dropped"] += 1
+                metrics.inc("archive_dropped")
+                if isinstance(frame, FrameLease):
+                    frame.release()
+                return None
+            self.pending += 1
+        now = time.time()
+        local = time.localtime(now)
+        path = (f"{time.strftime('%Y%m%d', local)}/{time.strftime('%H%M%S', local)}"
+                f"_{int(now % 1 * 1000):03d}_{next(self.sequence):06d}.jpg")
+        record = {"path": path, "captured_at": now, "label": label,
+                  "class_id": None if class_id is None else int(class_id),
+                  "confidence": None if confidence is None else float(confidence),
+                  "latency_ms": None if latency is None else latency * 1000, "request_id": request_id,
+                  "lane": lane, "thumbnail": thumbnail_path(path) if self.thumbnail_size else None}
+        self.encoder.submit(self._encode, frame, record, on_saved)
+        return path
+
+    def _encode_frame(self, frame):
+        ok, data = cv2.imencode(".jpg", frame, self.encode_params)
+        thumbnail = None
+        if ok and self.thumbnail_size:
+            small = cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+            ok, thumbnail = cv2.imencode(".jpg", small, self.encode_params)
+        return ok, data, thumbnail
+
+    def _encode(self, frame, record, on_saved):
+        try:
+            with metrics.span("archive_encode"):
+                if isinstance(frame, FrameLease):
+                    with frame:
+                        ok, data, thumbnail = self._encode_frame(frame.frame)
+                else:
+                    ok, data, thumbnail = self._encode_frame(frame)
+            if ok:
+                self.write_queue.put((record, data, thumbnail, on_saved))
+            else:
+                print(f"Failed to encode {record['path']}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def _connect(self):
+        db = sqlite3.connect(self.index_path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下斷電最多遺失最後幾筆索引，不會損毀
+        return db
+
+    def _write_loop(self):
+        db = self._connect()
+        self.total_bytes = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM captures").fetchone()[0]
+        last_prune = 0.0
+        while True:
+            try:
+                batch = [self.write_queue.get(timeout=1.0)]
+            except Empty:
+                batch = []
+            # 一次寫入佇列中所有已編碼的影像，索引以單一交易提交
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except Empty:
+                    break
+            stopping = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                with metrics.span("archive_write"):
+                    self._write_batch(db, batch)
+            if self.max_bytes and self.total_bytes > self.max_bytes or time.monotonic() - last_prune > self.prune_interval:
+                self._prune(db)
+                last_prune = time.monotonic()
+            if stopping:
+                break
+        db.close()
+
+    def _write_batch(self, db, batch):
+        rows = []
+        saved = []
+        for record, data, thumbnail, on_saved in batch:
+            full_path = os.path.join(self.root, record["path"])
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                with open(full_path, "wb") as f:
+                    f.write(data.tobytes())
+                if thumbnail is not None:
+                    with open(os.path.join(self.root, record["thumbnail"]), "wb") as f:
+                        f.write(thumbnail.tobytes())
+            except OSError as e:
+                print(f"Failed to write {full_path}: {e}")
+                continue
+            record["bytes"] = len(data) + (len(thumbnail) if thumbnail is not None else 0)
+            rows.append(tuple(record[column] for column in COLUMNS))
+            if on_saved is not None:
+                saved.append((on_saved, record))
+        with db:
+            db.executemany(f"INSERT OR REPLACE INTO captures ({', '.join(COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        self.total_bytes += sum(row[2] for row in rows)
+        self.counts["archived"] += len(rows)
+        for on_saved, record in saved:
+            try:
+                on_saved(record)
+            except Exception as e:
+                print(f"Archive callback failed for {record['path']}: {e}")
+
+    def _prune(self, db):
+        """Delete entries past max_age, then the oldest ones until the archive is below 90% of max_bytes"""
+        doomed = []
+        if self.max_age:
+            doomed += db.execute("SELECT id, path, bytes FROM captures WHERE captured_at < ?",
+                                 (time.time() - self.max_age,)).fetchall()
+        remaining = self.total_bytes - sum(size for _, _, size in doomed)
+        if self.max_bytes and remaining > self.max_bytes:
+            # 刪到上限的 90%，避免每寫一張就清一次
+            target = self.max_bytes * 0.9
+            seen = {row[0] for row in doomed}
+            for row in db.execute("SELECT id, path, bytes FROM captures ORDER BY captured_at"):
+                if remaining <= target:
+                    break
+                if row[0] not in seen:
+                    doomed.append(row)
+                    remaining -= row[2]
+        if not doomed:
+            return
+        directories = set()
+        for _, path, _ in doomed:
+            full_path = os.path.join(self.root, path)
+            directories.add(os.path.dirname(full_path))
+            for file_path in (full_path, os.path.join(self.root, thumbnail_path(path))):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+        with db:
+            db.executemany("DELETE FROM captures WHERE id = ?", [(row_id,) for row_id, _, _ in doomed])
+        for directory in directories:
+            try:
+                os.rmdir(directory)  # 只會移除已清空的日期資料夾
+            except OSError:
+                pass
+        self.total_bytes = remaining
+        self.counts["pruned"] += len(doomed)
+        print(f"Archive retention removed {len(doomed)} images, {self.total_bytes / 1024 ** 2:.1f} MiB kept")
+
+    def recent(self, limit=20):
+        """Newest archived entries as dicts, including their path relative to root"""
+        db = self._connect()
+        try:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute(
+                "SELECT * FROM captures ORDER BY captured_at DESC LIMIT ?", (limit,))]
+        finally:
+            db.close()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, pending=self.pending + self.write_queue.qsize(),
+                        megabytes=round(self.total_bytes / 1024 ** 2, 1))
+
+    def stop(self):
+        """Finish encoding and writing everything already submitted"""
+        if not self.running:
+            return
+        with self.lock:
+            self.running = False
+        self.encoder.shutdown(wait=True)
+        self.write_queue.put(None)
+        self.writer_thread.join()
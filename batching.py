@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+class MicroBatcher:
+    """Collect classification requests from many callers and run them as one batch.
+
+    A request waits at most max_wait_ms for others to join it, and a batch never
+    exceeds max_batch frames. Frames are read by the worker thread after submit()
+    returns, so callers must not modify them until the future resolves.
+    """
+
+    def __init__(self, classifier, max_batch=8, max_wait_ms=10):
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = Queue()
+        self.running = False
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        """Start the batching worker thread"""
+        if not self.running:
+            self.running = True
+            self.worker_thread = threading.Thread(target=self._batch_loop)
+            self.worker_thread.daemon = True
+            self.worker_thread.start()
+
+    def submit(self, frame):
+        """Queue a BGR frame for classification and return a Future for its label"""
+        future = Future()
+        self.requests.put((frame, future))
+        return future
+
+    def predict_frame(self, frame):
+        """Blocking drop-in for ONNXClassifier.predict_frame"""
+        return self.submit(frame).result()
+
+    def _batch_loop(self):
+        while self.running:
+            try:
+                batch = [self.requests.get(timeout=0.5)]
+            except Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # 已被呼叫端取消的請求不送進模型
+        batch = [(frame, future) for frame, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        frames = [frame for frame, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            labels = self.classifier.predict_frames(frames)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(frames)
+        for future, label in zip(futures, labels):
+            future.set_result(label)
+
+    def stats(self):
+        """Return the number of batches run and the average batch size"""
+        return {"batches": self.batches,
+                "items": self.items,
+                "avg_batch": self.items / self.batches if self.batches else 0.0}
+
+    def stop(self):
+        """Stop the worker thread and fail any requests still queued"""
+        self.running = False
+        if hasattr(self, "worker_thread"):
+            self.worker_thread.join()
+        while True:
+            try:
+                _, future = self.requests.get_nowait()
+            except Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("MicroBatcher stopped"))
@@ -0,0 +1,58 @@
+"""Throughput of one-by-one predict_frame calls vs the MicroBatcher under concurrent callers.
+
+Run from the repository root:
+    python -m benchmarks.bench_batching --model model.onnx [--callers 4] [--items 400]
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from ONNXClassifier import ONNXClassifier
+from batching import MicroBatcher
+
+def run_callers(predict, frames, callers, items):
+    per_caller = items // callers
+
+    def worker(offset):
+        for i in range(per_caller):
+            predict(frames[(offset + i) % len(frames)])
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_caller * callers / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="model.onnx")
+    parser.add_argument("--callers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    classifier = ONNXClassifier(args.model)
+    if classifier.max_batch is not None:
+        print(f"Warning: {args.model} has a fixed batch size of {classifier.max_batch}; "
+              "re-export with Classifier.export_to_onnx to enable batching")
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(16)]
+    classifier.predict_frame(frames[0])  # warm-up
+
+    single = run_callers(classifier.predict_frame, frames, args.callers, args.items)
+    print(f"one-by-one : {single:8.1f} items/s")
+
+    batcher = MicroBatcher(classifier, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batcher.start()
+    batched = run_callers(batcher.predict_frame, frames, args.callers, args.items)
+    stats = batcher.stats()
+    batcher.stop()
+    print(f"micro-batch: {batched:8.1f} items/s (avg batch {stats['avg_batch']:.1f}, x{batched / single:.2f})")
+
+if __name__ == "__main__":
+    main()
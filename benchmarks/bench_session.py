@@ -0,0 +1,63 @@
+"""Startup benchmark: session creation time and steady-state latency per ONNX Runtime configuration.
+
+Run from the repository root:
+    python -m benchmarks.bench_session --model model.onnx [--runs 100]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from ort_session import create_session
+
+CONFIGS = {
+    "default": {},
+    "no-opt": {"graph_optimization_level": "disable"},
+    "basic": {"graph_optimization_level": "basic"},
+    "1-thread": {"intra_op_num_threads": 1},
+    "2-threads": {"intra_op_num_threads": 2},
+    "4-threads": {"intra_op_num_threads": 4},
+    "no-arena": {"enable_cpu_mem_arena": False, "enable_mem_pattern": False},
+    "parallel": {"execution_mode": "parallel", "inter_op_num_threads": 2},
+}
+
+def steady_state_ms(session, runs, batch):
+    input_name = session.get_inputs()[0].name
+    tensor = np.random.default_rng(0).standard_normal((batch, 3, 224, 224)).astype(np.float32)
+    for _ in range(5):
+        session.run(None, {input_name: tensor})  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, {input_name: tensor})
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="model.onnx")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--providers", nargs="*", default=None)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="ort_cache_")
+    try:
+        print(f"{'config':<10} {'cold ms':>9} {'cached ms':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, settings in CONFIGS.items():
+            start = time.perf_counter()
+            create_session(args.model, providers=args.providers, cache_dir=cache_dir, **settings)
+            cold = (time.perf_counter() - start) * 1000
+            # 第二次建立會讀取磁碟上已最佳化的模型
+            start = time.perf_counter()
+            session = create_session(args.model, providers=args.providers, cache_dir=cache_dir, **settings)
+            cached = (time.perf_counter() - start) * 1000
+            p50, p99 = steady_state_ms(session, args.runs, args.batch)
+            print(f"{name:<10} {cold:>9.1f} {cached:>10.1f} {p50:>8.2f} {p99:>8.2f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""End-to-end sort cycle: synthetic camera -> motion trigger -> classifier -> stepper motor.
+
+Runs on a plain Linux box with the simulated pin backend, or on the Pi with a
+real one. Reports drop-to-bin latency broken down by stage, sorting accuracy
+against the training labels and the step timing the motor actually produced.
+
+Run from the repository root:
+    python -m benchmarks.bench_sort_cycle --model model.onnx [--items 20] [--pins sim-realtime]
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from ONNXClassifier import ONNXClassifier
+from gpio import StepperMotor
+from motion import MotionTrigger
+from pins import create_backend
+from synthetic_camera import SyntheticCamera
+
+def summarize(name, values):
+    values = np.asarray(values) * 1000
+    print(f"  {name:<10} mean {values.mean():7.1f} ms   p50 {np.percentile(values, 50):7.1f} ms   "
+          f"max {values.max():7.1f} ms")
+
+def run_cycle(classifier, camera, motor, items, timeout):
+    """Sort items from the synthetic camera; returns (records, elapsed seconds).
+
+    Each record is (correct, detect, classify, motor, drop->bin) with times in seconds.
+    """
+    records = []
+    done = threading.Event()
+
+    def on_item(lease):
+        triggered = time.perf_counter()
+        with lease:
+            item = camera.item_for_seq(lease.seq)
+            class_id, confidence = classifier.classify_frame(lease.frame)
+        classified = time.perf_counter()
+        motor.move_to_bin(class_id)
+        moved = time.perf_counter()
+        if item is None or item not in camera.item_log:
+            return
+        true_class, _, shown = camera.item_log[item]
+        records.append((true_class == class_id, triggered - shown, classified - triggered, moved - classified,
+                        moved - shown))
+        if len(records) >= items:
+            done.set()
+
+    trigger = MotionTrigger(camera, on_item)
+    camera.start()
+    trigger.start()
+    start = time.perf_counter()
+    done.wait(timeout=timeout)
+    elapsed = time.perf_counter() - start
+    trigger.stop()
+    camera.stop()
+    return records, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="model.onnx")
+    parser.add_argument("--images", default="training_image")
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--hold", type=float, default=1.5, help="seconds each item stays in view")
+    parser.add_argument("--gap", type=float, default=1.0, help="seconds of empty chute between items")
+    parser.add_argument("--pins", default="sim-realtime", help="pigpio, rpi, sim or sim-realtime")
+    args = parser.parse_args()
+
+    camera = SyntheticCamera(args.images, fps=args.fps, hold_seconds=args.hold, gap_seconds=args.gap)
+    classifier = ONNXClassifier(args.model)
+    pins = create_backend(args.pins)
+    motor = StepperMotor(pins=pins)
+    records, elapsed = run_cycle(classifier, camera, motor, args.items,
+                                 timeout=args.items * (args.hold + args.gap) * 3 + 10)
+
+    if not records:
+        print("No items were sorted")
+        return
+    correct, detect, classify, move, total = zip(*records)
+    print(f"{len(records)} items in {elapsed:.1f}s ({len(records) / elapsed * 60:.1f} items/min), "
+          f"accuracy {sum(correct) / len(records):.1%}, pin backend {pins.name}")
+    summarize("detect", detect)
+    summarize("classify", classify)
+    summarize("motor", move)
+    summarize("drop->bin", total)
+    if hasattr(pins, "step_intervals"):
+        intervals = pins.step_intervals(motor.step_pin)
+        if intervals:
+            print(f"  {len(pins.pulses(motor.step_pin))} steps, fastest step period {min(intervals) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Accuracy/latency comparison of FP32, INT8 and FP16 model variants on held-out images.
+
+Build the variants first with `python quantize.py --model model.onnx`, then run from the
+repository root:
+    python -m benchmarks.bench_variants [--models model.onnx model.int8.onnx model.fp16.onnx]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ONNXClassifier import ONNXClassifier
+from quantize import load_rgb, split_images
+
+def evaluate(model_path, holdout, class_mapping, runs):
+    classifier = ONNXClassifier(model_path, class_mapping)
+    images = [(load_rgb(path), class_mapping[label]) for path, label in holdout]
+    correct = 0
+    for image, expected in images:
+        tensor = classifier.preprocessor.preprocess(image, bgr=False)
+        correct += classifier._run(tensor)[0] == expected
+
+    # 延遲只量測 session.run，排除解碼與預處理
+    tensor = classifier.preprocessor.preprocess(images[0][0], bgr=False).astype(classifier.input_dtype)
+    feed = {classifier.input_name: tensor}
+    for _ in range(5):
+        classifier.session.run(None, feed)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        classifier.session.run(None, feed)
+        timings.append((time.perf_counter() - start) * 1000)
+    return correct / len(images), np.percentile(timings, 50), np.percentile(timings, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=["model.onnx", "model.int8.onnx", "model.fp16.onnx"])
+    parser.add_argument("--images", default="training_image")
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    _, holdout = split_images(args.images)
+    classes = sorted(d for d in os.listdir(args.images) if os.path.isdir(os.path.join(args.images, d)))
+    class_mapping = dict(enumerate(classes))
+
+    print(f"{len(holdout)} held-out images")
+    print(f"{'model':<24} {'size MB':>8} {'top-1':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for model_path in args.models:
+        if not os.path.exists(model_path):
+            print(f"{model_path:<24} missing, skipped")
+            continue
+        accuracy, p50, p99 = evaluate(model_path, holdout, class_mapping, args.runs)
+        size_mb = os.path.getsize(model_path) / 1e6
+        print(f"{os.path.basename(model_path):<24} {size_mb:>8.2f} {accuracy:>7.3f} {p50:>8.2f} {p99:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Load test for the sorter control server: many concurrent clients, messages/sec and tail latency.
+
+By default an in-process SorterServer with a no-op actuator is started on a free
+local port. Run from the repository root:
+    python -m benchmarks.loadtest_server [--clients 200] [--messages 50] [--lanes 10] [--window 8]
+    python -m benchmarks.loadtest_server --host 192.168.12.98 --port 65432
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import protocol
+from server import SorterServer
+
+async def run_client(host, port, lane, messages, window, latencies, client=0):
+    """One connection sending messages CLASSIFYs; client numbers its session and request IDs"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(protocol.encode(protocol.HELLO, client + 1, payload=lane))
+    await protocol.read_message(reader)
+    sent_at = {}
+    # 每個客戶端使用不同的 session 與 request ID 區段，伺服器才不會把同 lane 的訊息當成重送丟掉
+    next_id = first_id = client * messages + 1
+    received = 0
+    while received < messages:
+        # 最多 window 筆未確認的請求同時在途
+        while next_id < first_id + messages and len(sent_at) < window:
+            sent_at[next_id] = time.perf_counter()
+            writer.write(protocol.encode(protocol.CLASSIFY, next_id, next_id % 4, 0.9))
+            next_id += 1
+        await writer.drain()
+        ack = await protocol.read_message(reader)
+        latencies.append(time.perf_counter() - sent_at.pop(ack.request_id))
+        received += 1
+    writer.close()
+    await writer.wait_closed()
+
+async def main(args):
+    server = None
+    host, port = args.host, args.port
+    if host is None:
+        server = SorterServer(host="127.0.0.1", port=0, actuator=lambda lane, bin_number: None,
+                              stats_interval=0, verbose=False)
+        await server.start()
+        host, port = "127.0.0.1", server.port
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, f"lane{c % args.lanes}", args.messages, args.window, latencies, c)
+                           for c in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    print(f"{args.clients} clients x {args.messages} messages in {elapsed:.2f} s")
+    print(f"throughput: {len(latencies) / elapsed:.0f} msg/s")
+    print(f"latency ms: p50 {np.percentile(ms, 50):.2f}  p99 {np.percentile(ms, 99):.2f}  max {ms.max():.2f}")
+    if server:
+        stats = server.stats()
+        print(f"server: {stats['total_connections']} connections, {stats['messages']} messages, "
+              f"{stats['duplicates']} duplicates, {len(stats['lanes'])} lanes")
+        server.server.close()
+        await server.server.wait_closed()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=None, help="Target an existing server instead of a local one")
+    parser.add_argument("--port", type=int, default=65432)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--lanes", type=int, default=10)
+    parser.add_argument("--window", type=int, default=1, help="Unacknowledged messages in flight per client")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,223 @@
+"""Reproducible benchmark suite for the classify-and-sort hot path, with JSON results and baselines.
+
+Every case runs offline against training_image/ and the synthetic camera, with
+fixed seeds and warm-up runs:
+
+    classify    preprocess_image + predict latency, and batched throughput at
+                several batch sizes and intra-op thread counts
+    mjpeg       JPEG encode cost per streamed frame at full and reduced size
+    socket      CLASSIFY/ACK round trips through an in-process server.py
+    sort_cycle  synthetic camera -> motion trigger -> classifier -> simulated motor
+
+Results are written as JSON together with the machine, library versions and
+model they were measured on. --save-baseline stores them under
+benchmarks/baselines/<name>.json; --compare checks a run against a stored
+baseline and exits with status 1 when any metric regressed by more than
+--tolerance. Baselines are machine specific, so record one per target device.
+
+Run from the repository root:
+    python -m benchmarks.suite --model model.onnx [--only classify,socket]
+    python -m benchmarks.suite --save-baseline pi4
+    python -m benchmarks.suite --compare pi4 [--tolerance 0.1]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+import protocol
+from ONNXClassifier import ONNXClassifier
+from gpio import StepperMotor
+from mjpeg import MJPEGBroadcaster
+from pins import SimulatedPins
+from server import SorterServer
+from synthetic_camera import SyntheticCamera
+from benchmarks.bench_sort_cycle import run_cycle
+from benchmarks.loadtest_server import run_client
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def metric(value, unit, better):
+    return {"value": round(float(value), 4), "unit": unit, "better": better}
+
+def timed(fn, runs, warmup=3):
+    """Per-call wall time in milliseconds after warm-up"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+def bench_classify(args):
+    results = {}
+    paths = sorted(glob.glob(os.path.join(args.images, "*", "*")))[:16]
+    classifier = ONNXClassifier(args.model)
+    paths_cycle = iter(paths * (args.runs // len(paths) + 10))
+    predict_ms = timed(lambda: classifier.predict(next(paths_cycle)), args.runs)
+    results["classify.predict_image.p50_ms"] = metric(np.percentile(predict_ms, 50), "ms", "lower")
+    results["classify.predict_image.p99_ms"] = metric(np.percentile(predict_ms, 99), "ms", "lower")
+
+    frames = [image for _, _, image in SyntheticCamera(args.images).images[:16]]
+    for threads in args.threads:
+        classifier = ONNXClassifier(args.model, session_config={"intra_op_num_threads": threads})
+        for batch in args.batches:
+            batch_frames = (frames * batch)[:batch]
+            timings = timed(lambda: classifier.predict_scores(batch_frames), max(args.runs // batch, 10))
+            key = f"classify.batch{batch}.threads{threads}"
+            results[f"{key}.items_per_sec"] = metric(batch * 1000 / np.median(timings), "items/s", "higher")
+            results[f"{key}.p50_ms"] = metric(np.percentile(timings, 50), "ms", "lower")
+    return results
+
+def bench_mjpeg(args):
+    results = {}
+    frames = [image for _, _, image in SyntheticCamera(args.images).images[:16]]
+    for name, size in (("640x480", None), ("320x240", (320, 240))):
+        broadcaster = MJPEGBroadcaster(camera=None, quality=80, size=size)
+        frame_cycle = iter(frames * (args.runs // len(frames) + 10))
+        timings = timed(lambda: broadcaster._encode(next(frame_cycle)), args.runs)
+        results[f"mjpeg.encode_{name}.p50_ms"] = metric(np.percentile(timings, 50), "ms", "lower")
+        part_bytes = len(broadcaster._encode(frames[0]))
+        results[f"mjpeg.encode_{name}.kib_per_frame"] = metric(part_bytes / 1024, "KiB", "lower")
+    return results
+
+async def _socket_case(clients, messages, window):
+    server = SorterServer(host="127.0.0.1", port=0, actuator=lambda lane, bin_number: None,
+                          stats_interval=0, verbose=False)
+    await server.start()
+    latencies = []
+    start = time.perf_counter()
+    # client 編號決定 session 與 request ID 區段，量到的是 actuator 佇列而不是重複訊息的捷徑
+    await asyncio.gather(*(run_client("127.0.0.1", server.port, f"lane{c % 4}", messages, window, latencies, c)
+                           for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    server.server.close()
+    await server.server.wait_closed()
+    if server.duplicates:
+        raise RuntimeError(f"{server.duplicates} messages were discarded as duplicates")
+    return np.array(latencies) * 1000, len(latencies) / elapsed
+
+def bench_socket(args):
+    results = {}
+    latencies, _ = asyncio.run(_socket_case(clients=1, messages=args.runs * 2, window=1))
+    results["socket.round_trip.p50_ms"] = metric(np.percentile(latencies, 50), "ms", "lower")
+    results["socket.round_trip.p99_ms"] = metric(np.percentile(latencies, 99), "ms", "lower")
+    _, throughput = asyncio.run(_socket_case(clients=50, messages=args.runs, window=8))
+    results["socket.throughput_50_clients.msg_per_sec"] = metric(throughput, "msg/s", "higher")
+    return results
+
+def bench_sort_cycle(args):
+    camera = SyntheticCamera(args.images, hold_seconds=1.0, gap_seconds=0.6)
+    classifier = ONNXClassifier(args.model)
+    motor = StepperMotor(pins=SimulatedPins(realtime=True))
+    records, elapsed = run_cycle(classifier, camera, motor, args.items, timeout=args.items * 5 + 10)
+    if not records:
+        raise RuntimeError("no items were sorted")
+    _, detect, classify, move, total = (np.array(column) * 1000 for column in zip(*records))
+    return {
+        "sort_cycle.detect.p50_ms": metric(np.percentile(detect, 50), "ms", "lower"),
+        "sort_cycle.classify.p50_ms": metric(np.percentile(classify, 50), "ms", "lower"),
+        "sort_cycle.motor.p50_ms": metric(np.percentile(move, 50), "ms", "lower"),
+        "sort_cycle.drop_to_bin.p50_ms": metric(np.percentile(total, 50), "ms", "lower"),
+        "sort_cycle.items_per_min": metric(len(records) / elapsed * 60, "items/min", "higher"),
+    }
+
+CASES = {
+    "classify": bench_classify,
+    "mjpeg": bench_mjpeg,
+    "socket": bench_socket,
+    "sort_cycle": bench_sort_cycle,
+}
+
+def environment(args):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "onnxruntime": ort.__version__,
+        "model": os.path.basename(args.model),
+        "model_bytes": os.path.getsize(args.model),
+        "protocol_version": protocol.VERSION,
+    }
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table; returns the names of metrics that regressed beyond tolerance"""
+    regressions = []
+    print(f"\n{'metric':<48} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<48} {'-':>10} {current['value']:>10.3f}")
+            continue
+        change = (current["value"] - base["value"]) / base["value"]
+        worse = change > tolerance if current["better"] == "lower" else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{name:<48} {base['value']:>10.3f} {current['value']:>10.3f} {change:>+8.1%}"
+              f"{'  REGRESSION' if worse else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="model.onnx")
+    parser.add_argument("--images", default="training_image")
+    parser.add_argument("--only", default=",".join(CASES), help="comma-separated cases to run")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--items", type=int, default=6, help="items sorted in the sort_cycle case")
+    parser.add_argument("--output", default=None, help="results JSON path (default benchmarks/results/<time>.json)")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only.split(","):
+        print(f"Running {name}...")
+        start = time.perf_counter()
+        results.update(CASES[name](args))
+        print(f"  done in {time.perf_counter() - start:.1f}s")
+    for name, value in results.items():
+        print(f"{name:<48} {value['value']:>10.3f} {value['unit']}")
+
+    report = {"environment": environment(args), "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if baseline["environment"]["machine"] != report["environment"]["machine"]:
+            print(f"Warning: baseline was recorded on {baseline['environment']['machine']}")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
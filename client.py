@@ -1,99 +1,120 @@
-import socket
+import sys
 import threading
 import time
-from queue import Queue
-import cv2
 import keyboard
 from USBCamera import USBCamera
 from ONNXClassifier import ONNXClassifier
+from motion import MotionTrigger
+from voting import TemporalVoter
+from pipeline import SortingPipeline
+from phash_cache import PerceptualCache
+from archive import CaptureArchive
+import metrics
+import protocol
+from sorter_client import SorterConnection
 
 HOST = "192.168.12.98" 
 PORT = 65432
 
 class CameraClient:
-    def __init__(self):
+    def __init__(self, save_captures=True, auto_trigger=False, temporal_voting=False, result_cache=False):
         self.camera = USBCamera(camera_index=2)
         self.running = False
+        self.save_captures = save_captures
+        # 自動模式：偵測到物品放入並靜止後自動分類，不需按 Enter
+        self.trigger = MotionTrigger(self.camera, self.process_trigger) if auto_trigger else None
         
         self.class_mapping = {0: "bottle", 1: "glass_bottle", 2: "iron", 3: "paper"}
 
         self.classifier = ONNXClassifier("model.onnx", self.class_mapping)
+        # 多幀投票：連拍數張畫面合併判斷，信心足夠即提前結束
+        self.voter = TemporalVoter(self.classifier) if temporal_voting else None
+        # 前處理、推論、送出分別在各自的線程執行，下一個物品不必等上一個處理完
+        # --cache：畫面與前一次完全相同時（重複按鍵）直接沿用結果，不再推論
+        # 預設關閉：槽內背景不變，不同物品的雜湊可能相近而沿用到錯誤的結果
+        self.result_cache = PerceptualCache() if result_cache else None
+        self.pipeline = SortingPipeline(self.classifier, dispatch=self.dispatch_item, result_cache=self.result_cache)
         
-        self.socket = None
+        # 持續連線並自動重連，斷線期間的結果暫存在佇列中
+        self.sorter = SorterConnection(HOST, PORT, on_message=self.on_server_message)
         
-        self.save_queue = Queue()
+        # 背景編碼存檔，依日期分資料夾並記錄預測結果，超過容量或天數的舊檔自動刪除
+        self.archive = CaptureArchive("captures")
 
-    def receive_messages(self, sock):
-        try:
-            while self.running:
-                data = sock.recv(1024)
-                if not data:
-                    print("Server disconnected")
-                    break
-                print(f"\nServer: {data.decode('utf-8')}")
-        except Exception as e:
-            print(f"Error receiving: {e}")
-        finally:
-            sock.close()
-            print("Connection closed")
+    def on_server_message(self, message):
+        print(f"\nServer: {protocol.describe(message)}")
 
-    def connect_to_server(self):
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            print(f"Connecting to {HOST}:{PORT}...")
-            self.socket.connect((HOST, PORT))
-            print("Connected to server")
-            
-            receive_thread = threading.Thread(target=self.receive_messages, args=(self.socket,))
-            receive_thread.daemon = True
-            receive_thread.start()
-            return True
-        except ConnectionRefusedError:
-            print(f"Connection to {HOST}:{PORT} refused. Is the server running?")
-            return False
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
+    def send_to_server(self, class_id, confidence):
+        request_id = self.sorter.send_classification(class_id, confidence)
+        print(f"Queued for server: #{request_id} class {class_id}")
+        return request_id
 
-    def send_to_server(self, message):
-        try:
-            self.socket.sendall(message.encode('utf-8'))
-            print(f"Sent to server: {message}")
-        except Exception as e:
-            print(f"Error sending to server: {e}")
+    def process_trigger(self, lease):
+        # 動作偵測到新物品：先清空結果快取，不沿用上一個物品的結果
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        self.process_lease(lease)
+
+    def process_lease(self, lease):
+        if not self.voter:
+            self.pipeline.submit(lease)
+            return
+
+        prediction, confidence, frames_used = self.voter.classify(self.camera, lease)
+        class_id = self.classifier.class_id(prediction)
+        print(f"Model prediction: {prediction} (confidence {confidence:.2f}, {frames_used} frames)")
+        request_id = self.send_to_server(class_id, confidence)
+        self.save_lease(lease, prediction, class_id, confidence, request_id)
+
+    def dispatch_item(self, item):
+        cached = " [cached]" if item.cached else ""
+        print(f"Model prediction: {item.label} (confidence {item.confidence:.2f}){cached}")
+        request_id = self.send_to_server(item.class_id, item.confidence)
+        metrics.annotate(item.id, request_id=request_id, label=item.label)
+        self.save_lease(item.lease, item.label, item.class_id, item.confidence, request_id,
+                        latency=time.perf_counter() - item.times["captured"])
+        item.lease = None
+
+    def save_lease(self, lease, label=None, class_id=None, confidence=None, request_id=None, latency=None):
+        if self.save_captures:
+            self.archive.submit(lease, label=label, class_id=class_id, confidence=confidence,
+                                latency=latency, request_id=request_id)
+        else:
+            lease.release()
 
     def capture_and_process(self):
         while self.running:
             if keyboard.is_pressed('enter'):
-                timestamp = time.strftime("%Y%m%d_%H%M%S")
-                filename = f"capture_{timestamp}.jpg"
-                self.camera.request_save(filename)
-                
-                time.sleep(0.5)
-                
-                prediction = self.classifier.predict(filename)
-                print(f"Model prediction: {prediction}")
+                lease = self.camera.lease_frame()
+                if lease is None:
+                    print("No frame available")
+                    time.sleep(0.5)
+                    continue
 
-                keys = [key for key, value in self.class_mapping.items() if value == prediction]
-                
-                self.send_to_server(f"{keys[0]+1}")
+                self.process_lease(lease)
                 
-                time.sleep(0.5)
+                # 等放開按鍵再接受下一次觸發，處理中的物品不會擋住下一次擷取
+                while self.running and keyboard.is_pressed('enter'):
+                    time.sleep(0.01)
             time.sleep(0.01)
 
     def start(self):
         self.running = True
         self.camera.start()
+        self.archive.start()
         
-        if not self.connect_to_server():
-            self.stop()
-            return
+        self.sorter.start()
+        self.pipeline.start()
         
-        process_thread = threading.Thread(target=self.capture_and_process)
-        process_thread.daemon = True
-        process_thread.start()
-        
-        print("Client started. Press Enter to capture and classify, Ctrl+C to exit")
+        if self.trigger:
+            self.trigger.start()
+            print("Client started in auto-trigger mode, Ctrl+C to exit")
+        else:
+            process_thread = threading.Thread(target=self.capture_and_process)
+            process_thread.daemon = True
+            process_thread.start()
+            
+            print("Client started. Press Enter to capture and classify, Ctrl+C to exit")
         
         try:
             while self.running:
@@ -104,11 +125,25 @@ class CameraClient:
 
     def stop(self):
         self.running = False
+        if self.trigger:
+            self.trigger.stop()
+        self.pipeline.stop()
         self.camera.stop()
-        if self.socket:
-            self.socket.close()
-        print("Client stopped")
+        self.archive.stop()
+        self.sorter.stop()
+        print(f"Client stopped, pipeline stats: {self.pipeline.stats()}")
+        print(f"Sorter stats: {self.sorter.stats()}")
+        if self.result_cache is not None:
+            print(f"Result cache: {self.result_cache.stats()}")
+        print(f"Archive: {self.archive.stats()}")
+        if metrics.enabled:
+            print(metrics.summary())
 
 if __name__ == "__main__":
-    client = CameraClient()
+    if "--metrics" in sys.argv:
+        # 每 30 秒印出各階段延遲統計
+        metrics.enable()
+        metrics.start_dump()
+    client = CameraClient(auto_trigger="--auto" in sys.argv, temporal_voting="--vote" in sys.argv,
+                          result_cache="--cache" in sys.argv)
     client.start()
\ No newline at end of file
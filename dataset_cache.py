@@ -0,0 +1,189 @@
+"""Decode-once image cache for training.
+
+build_cache() decodes every image under an ImageFolder-style root (one
+sub-directory per class) a single time, resizes it and stores all images in one
+uint8 .npy array next to a JSON index of source files, labels and modification
+times. Training then memory-maps the array, so an epoch reads pre-decoded
+pixels instead of re-decoding the full-size JPEGs. When photos are added or
+changed only those files are decoded again.
+
+CachedImageDataset serves (uint8 HWC image, label) pairs with optional random
+crop / flip / brightness-contrast augmentation. The default DataLoader collate
+turns them into uint8 tensors, which are 4x smaller to pin and copy than float
+input; normalization happens on the training device (see model.Classifier).
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+DEFAULT_CACHE_DIR = ".dataset_cache"
+
+def scan(root):
+    """List (relative path, label, mtime_ns, size) for every image under root; returns (classes, entries)"""
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    entries = []
+    for label, name in enumerate(classes):
+        for file_name in sorted(os.listdir(os.path.join(root, name))):
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = os.stat(os.path.join(root, name, file_name))
+            entries.append((f"{name}/{file_name}", label, stat.st_mtime_ns, stat.st_size))
+    return classes, entries
+
+def decode(path, size):
+    """Decode an image file to an RGB uint8 array resized to size (width, height), or None if unreadable"""
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+def cache_paths(root, cache_dir, size):
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:8]
+    base = os.path.join(cache_dir, f"{os.path.basename(os.path.normpath(root))}-{key}-{size[0]}x{size[1]}")
+    return base + ".npy", base + ".json"
+
+class ImageCache:
+    """A built cache: memory-mapped uint8 images (N, H, W, 3) plus labels and class names.
+
+    The memory map is opened lazily in each process, so the cache can be handed
+    to DataLoader workers without copying the pixel data.
+    """
+
+    def __init__(self, array_path, index):
+        self.array_path = array_path
+        self.classes = index["classes"]
+        self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.files = [entry[0] for entry in index["entries"]]
+        self.labels = np.array([entry[1] for entry in index["entries"]], dtype=np.int64)
+        self._images = None
+        self._pid = None
+
+    @property
+    def images(self):
+        if self._images is None or self._pid != os.getpid():
+            self._images = np.load(self.array_path, mmap_mode="r")
+            self._pid = os.getpid()
+        return self._images
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_images"] = None
+        return state
+
+def build_cache(root, cache_dir=DEFAULT_CACHE_DIR, size=(256, 256), workers=None):
+    """Build or refresh the cache for root and return it as an ImageCache.
+
+    Images are stored slightly larger than the 224x224 model input so training
+    crops have room to move. Unchanged files are copied from the previous cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    array_path, index_path = cache_paths(root, cache_dir, size)
+    classes, entries = scan(root)
+
+    previous = {}
+    skipped = set()
+    old_images = None
+    if os.path.exists(index_path) and os.path.exists(array_path):
+        with open(index_path) as f:
+            old_index = json.load(f)
+        old_entries = [tuple(entry) for entry in old_index["entries"]]
+        skipped = {tuple(entry) for entry in old_index.get("skipped", [])}
+        if old_index["classes"] == classes and sorted(old_entries + list(skipped)) == sorted(entries):
+            return ImageCache(array_path, old_index)
+        old_images = np.load(array_path, mmap_mode="r")
+        previous = {entry: row for row, entry in enumerate(old_entries)}
+
+    # 只解碼新增或修改過的圖片（cv2 解碼時會釋放 GIL，可用執行緒平行處理）
+    missing = [entry for entry in entries if entry not in previous and entry not in skipped]
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        decoded = dict(zip(missing, pool.map(lambda e: decode(os.path.join(root, e[0]), size), missing)))
+    for entry, image in decoded.items():
+        if image is None:
+            print(f"Skipping unreadable image {entry[0]}")
+    skipped = [entry for entry in entries if entry in skipped or decoded.get(entry, 0) is None]
+    entries = [entry for entry in entries if entry in previous or decoded.get(entry) is not None]
+
+    tmp_path = array_path + ".tmp.npy"
+    images = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                       shape=(len(entries), size[1], size[0], 3))
+    for row, entry in enumerate(entries):
+        images[row] = old_images[previous[entry]] if entry in previous else decoded[entry]
+    images.flush()
+    del images, old_images
+    os.replace(tmp_path, array_path)
+
+    index = {"root": os.path.abspath(root), "size": list(size), "classes": classes,
+             "entries": [list(entry) for entry in entries], "skipped": [list(entry) for entry in skipped]}
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    print(f"Cached {len(entries)} images from {root} ({len(missing)} decoded) in {array_path}")
+    return ImageCache(array_path, index)
+
+def augment(image, rng, output_size, scale=(0.7, 1.0), jitter=0.2):
+    """Random crop covering scale of the area, resize, horizontal flip and brightness/contrast jitter"""
+    height, width = image.shape[:2]
+    area = rng.uniform(*scale)
+    aspect = np.exp(rng.uniform(np.log(3 / 4), np.log(4 / 3)))
+    crop_w = min(width, int(round(width * np.sqrt(area * aspect))))
+    crop_h = min(height, int(round(height * np.sqrt(area / aspect))))
+    x = rng.integers(0, width - crop_w + 1)
+    y = rng.integers(0, height - crop_h + 1)
+    image = cv2.resize(image[y:y + crop_h, x:x + crop_w], output_size, interpolation=cv2.INTER_LINEAR)
+    if rng.random() < 0.5:
+        image = image[:, ::-1]
+    contrast = rng.uniform(1 - jitter, 1 + jitter)
+    brightness = rng.uniform(-jitter, jitter) * 255
+    return cv2.convertScaleAbs(image, alpha=contrast, beta=brightness)
+
+class CachedImageDataset:
+    """Map-style dataset over an ImageCache returning (uint8 HWC image, label).
+
+    Without augmentation images are resized whole to output_size, matching how
+    the deployed Preprocessor squashes camera frames.
+    """
+
+    def __init__(self, cache, output_size=(224, 224), augment=False):
+        self.cache = cache
+        self.output_size = output_size
+        self.augment = augment
+        self.classes = cache.classes
+        self.class_to_idx = cache.class_to_idx
+        self._rng = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.cache)
+
+    def _generator(self):
+        # 每個 DataLoader worker 各自建立亂數產生器，避免各 worker 產生相同的增強
+        if self._rng is None or self._pid != os.getpid():
+            self._rng = np.random.default_rng()
+            self._pid = os.getpid()
+        return self._rng
+
+    def __getitem__(self, index):
+        image = self.cache.images[index]
+        if self.augment:
+            image = augment(image, self._generator(), self.output_size)
+        elif image.shape[1::-1] != self.output_size:
+            image = cv2.resize(image, self.output_size, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(image), int(self.cache.labels[index])
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    root = sys.argv[1] if len(sys.argv) > 1 else "training_image"
+    start = time.perf_counter()
+    cache = build_cache(root)
+    print(f"{len(cache)} images, classes {cache.classes}, built in {time.perf_counter() - start:.2f}s")
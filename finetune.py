@@ -0,0 +1,182 @@
+"""Incremental fine-tuning of the classifier head from labeled photos.
+
+The ResNet18 backbone stays frozen, so each image only ever goes through it
+once: its 512-d penultimate-layer embedding is cached on disk, keyed by the
+SHA-1 of the file contents, in a cache file tied to the backbone weights. A run
+hashes the labeled images, embeds only the ones it has not seen, fits a new fc
+layer on the cached embeddings in seconds and exports the whole network to
+ONNX. The model file is replaced atomically, so a running ONNXClassifier can
+switch to it with reload().
+
+Labeled images come from ImageFolder-style roots (one sub-directory per class)
+plus an optional JSON file mapping image paths to class names, e.g. photos from
+static/captures with corrected labels. A label in that file overrides the label
+of the same image found in a folder.
+
+    python finetune.py --data training_image --labels corrections.json --weights model.pth --output model.onnx
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision import models
+
+from preprocess import Preprocessor
+
+DEFAULT_CACHE_DIR = ".embedding_cache"
+
+def file_hash(path):
+    """SHA-1 of the file contents"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def collect_images(roots, labels_path=None):
+    """Gather (path, class name) pairs from ImageFolder roots and a JSON {path: class name} file"""
+    labeled = {}
+    for root in roots:
+        for name in sorted(os.listdir(root)):
+            folder = os.path.join(root, name)
+            if os.path.isdir(folder):
+                for file_name in sorted(os.listdir(folder)):
+                    labeled[os.path.abspath(os.path.join(folder, file_name))] = name
+    if labels_path:
+        with open(labels_path) as f:
+            for path, name in json.load(f).items():
+                labeled[os.path.abspath(path)] = name
+    return list(labeled.items())
+
+class EmbeddingCache:
+    """Content hash -> embedding store persisted as one .npz file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.embeddings = {}
+        if os.path.exists(path):
+            data = np.load(path)
+            self.embeddings = dict(zip(data["hashes"].tolist(), data["embeddings"]))
+
+    def save(self):
+        hashes = sorted(self.embeddings)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, hashes=np.array(hashes), embeddings=np.stack([self.embeddings[h] for h in hashes]))
+        os.replace(tmp_path, self.path)
+
+class HeadTrainer:
+    """Frozen ResNet18 backbone with cached embeddings and a retrainable fc head"""
+
+    def __init__(self, weights=None, device=None, cache_dir=DEFAULT_CACHE_DIR, batch_size=32):
+        self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
+        self.batch_size = batch_size
+        self.model = models.resnet18(pretrained=weights is None)
+        if weights:
+            state = torch.load(weights, map_location="cpu")
+            self.model.fc = nn.Linear(self.model.fc.in_features, state["fc.weight"].shape[0])
+            self.model.load_state_dict(state)
+        self.previous_head = self.model.fc
+        self.model.fc = nn.Identity()
+        self.model.to(self.device).eval()
+
+        # 快取檔以骨幹權重的雜湊命名，換了骨幹就不會誤用舊的特徵
+        digest = hashlib.sha1()
+        for name, tensor in sorted(self.model.state_dict().items()):
+            digest.update(name.encode("utf-8"))
+            digest.update(tensor.cpu().numpy().tobytes())
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache = EmbeddingCache(os.path.join(cache_dir, f"resnet18-{digest.hexdigest()[:12]}.npz"))
+        self.preprocessor = Preprocessor(max_batch=batch_size)
+
+    def embed(self, images):
+        """Embeddings for (path, class name) pairs; only images not in the cache go through the backbone"""
+        hashes = [file_hash(path) for path, _ in images]
+        missing = [(path, h) for (path, _), h in zip(images, hashes) if h not in self.cache.embeddings]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            frames = [cv2.imread(path) for path, _ in chunk]
+            keep = [(frame, h) for frame, (path, h) in zip(frames, chunk) if frame is not None]
+            if not keep:
+                continue
+            # 與部署時相同的預處理（ONNXClassifier 使用的 Preprocessor）
+            tensor = torch.from_numpy(self.preprocessor([frame for frame, _ in keep])).to(self.device)
+            with torch.no_grad():
+                features = self.model(tensor).cpu().numpy()
+            for (_, h), feature in zip(keep, features):
+                self.cache.embeddings[h] = feature
+        if missing and self.cache.embeddings:
+            self.cache.save()
+        return hashes, len(missing)
+
+    def fit_head(self, features, labels, num_classes, epochs=300, lr=0.01, weight_decay=1e-4):
+        """Train a new fc layer full-batch on the embeddings"""
+        head = nn.Linear(features.shape[1], num_classes).to(self.device)
+        if self.previous_head.out_features == num_classes:
+            head.load_state_dict(self.previous_head.state_dict())  # 類別數不變時從舊的 fc 繼續訓練
+        x = torch.from_numpy(features).to(self.device)
+        y = torch.from_numpy(labels).to(self.device)
+        optimizer = torch.optim.Adam(head.parameters(), lr=lr, weight_decay=weight_decay)
+        criterion = nn.CrossEntropyLoss()
+        for _ in range(epochs):
+            optimizer.zero_grad()
+            loss = criterion(head(x), y)
+            loss.backward()
+            optimizer.step()
+        return head, float(loss.item())
+
+    def export(self, head, onnx_path):
+        """Export backbone + head to ONNX, replacing onnx_path atomically"""
+        self.model.fc = head
+        try:
+            dummy_input = torch.randn(1, 3, 224, 224).to(self.device)
+            tmp_path = onnx_path + ".tmp"
+            # 與 Classifier.export_to_onnx 相同的輸入輸出名稱與動態 batch 維度
+            torch.onnx.export(self.model, dummy_input, tmp_path, export_params=True, opset_version=11,
+                              input_names=['input'], output_names=['output'],
+                              dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}})
+            os.replace(tmp_path, onnx_path)
+        finally:
+            self.model.fc = nn.Identity()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", nargs="+", default=["training_image"], help="ImageFolder-style roots")
+    parser.add_argument("--labels", default=None, help="JSON file mapping image paths to class names")
+    parser.add_argument("--weights", default=None, help="state dict from Classifier.save_model for the backbone")
+    parser.add_argument("--output", default="model.onnx")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--holdout-every", type=int, default=5, help="every Nth image is held out for accuracy")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    images = collect_images(args.data, args.labels)
+    classes = sorted({name for _, name in images})
+    trainer = HeadTrainer(args.weights, cache_dir=args.cache_dir)
+    hashes, computed = trainer.embed(images)
+    print(f"{len(images)} images, {computed} new embeddings computed, {len(classes)} classes: {classes}")
+
+    rows = [(trainer.cache.embeddings[h], classes.index(name)) for h, (_, name) in zip(hashes, images)
+            if h in trainer.cache.embeddings]
+    features = np.stack([feature for feature, _ in rows]).astype(np.float32)
+    labels = np.array([label for _, label in rows], dtype=np.int64)
+    holdout = np.zeros(len(rows), dtype=bool)
+    if args.holdout_every:
+        holdout[::args.holdout_every] = True
+        head, loss = trainer.fit_head(features[~holdout], labels[~holdout], len(classes), args.epochs)
+        with torch.no_grad():
+            predictions = head(torch.from_numpy(features[holdout]).to(trainer.device)).argmax(1).cpu().numpy()
+        print(f"Held-out accuracy: {(predictions == labels[holdout]).mean():.3f} ({holdout.sum()} images)")
+    # 最終模型使用全部資料訓練
+    head, loss = trainer.fit_head(features, labels, len(classes), args.epochs)
+    print(f"Head trained, final loss {loss:.4f}")
+
+    trainer.export(head, args.output)
+    print(f"Exported {args.output} in {time.perf_counter() - start:.1f}s; "
+          f"class order {dict(enumerate(classes))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import threading
+import numpy as np
+import metrics
+
+class FrameLease:
+    """A reference-counted, read-only view of one ring slot; release it (or use `with`) when done"""
+
+    def __init__(self, ring, index, seq, frame):
+        self.ring = ring
+        self.index = index
+        self.seq = seq
+        self.frame = frame
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.ring.release(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class FrameRing:
+    """Fixed set of preallocated frame buffers that the capture thread decodes into.
+
+    The writer always picks a slot that is neither the latest frame nor leased, so a
+    lease stays valid without copying until it is released. If every slot is busy the
+    ring grows by one slot, up to max_slots (twice the initial size by default),
+    rather than overwrite a frame someone is still reading. Beyond that the new frame
+    is dropped: acquire_write() hands out a scratch buffer with index None, so the
+    device is still read, and the drop is counted as frames_dropped in metrics.
+    """
+
+    def __init__(self, slots=4, shape=(480, 640, 3), max_slots=None):
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(slots)]
+        self.refcounts = [0] * slots
+        self.seqs = [0] * slots
+        self.max_slots = max(max_slots or slots * 2, slots)
+        self.latest = None
+        self.lock = threading.Lock()
+        self._next = 0
+        self._scratch = None
+        self.dropped = 0
+        self._dropping = False
+
+    def acquire_write(self):
+        """Return (index, buffer) of a slot that is safe to overwrite, or (None, scratch buffer) when the ring is full"""
+        with self.lock:
+            count = len(self.buffers)
+            for offset in range(count):
+                index = (self._next + offset) % count
+                if index != self.latest and self.refcounts[index] == 0:
+                    self._next = (index + 1) % count
+                    self._dropping = False
+                    return index, self.buffers[index]
+            if count < self.max_slots:
+                print(f"All {count} frame buffers are leased, growing the ring")
+                self.buffers.append(np.empty_like(self.buffers[0]))
+                self.refcounts.append(0)
+                self.seqs.append(0)
+                return count, self.buffers[count]
+            # 已達上限（多半是有 lease 沒釋放）：丟棄這張畫面，只在開始丟棄時印一次
+            if not self._dropping:
+                print(f"All {count} frame buffers are leased, dropping frames until one is released")
+                self._dropping = True
+            self.dropped += 1
+            metrics.inc("frames_dropped")
+            if self._scratch is None:
+                self._scratch = np.empty_like(self.buffers[0])
+            return None, self._scratch
+
+    def publish(self, index, seq, frame=None):
+        """Mark a written slot as the latest frame; frame replaces the buffer if the decoder reallocated it"""
+        with self.lock:
+            if frame is not None and frame is not self.buffers[index]:
+                self.buffers[index] = frame
+            self.seqs[index] = seq
+            self.latest = index
+
+    def view(self, index):
+        frame = self.buffers[index].view()
+        frame.flags.writeable = False
+        return frame
+
+    def lease_latest(self):
+        """Lease the latest frame, or return None if nothing was published yet"""
+        with self.lock:
+            if self.latest is None:
+                return None
+            index = self.latest
+            self.refcounts[index] += 1
+            return FrameLease(self, index, self.seqs[index], self.view(index))
+
+    def release(self, index):
+        with self.lock:
+            self.refcounts[index] -= 1
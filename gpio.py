@@ -1,13 +1,28 @@
-import RPi.GPIO as GPIO
-from time import DSHOW
+import math
+from time import sleep
+from pins import SimulatedPins, default_backend
+import metrics
 
 class StepperMotor:
-    def __init__(self, dir_pin=10, step_pin=8, steps_per_revolution=200):
+    """Stepper-driven chute with absolute position tracking and trapezoidal speed ramps.
+
+    Every move starts at start_speed, accelerates at acceleration (steps/s^2) up to
+    max_speed, cruises and decelerates symmetrically, so short moves become
+    triangular profiles. The chute position is tracked in steps, which lets
+    move_to_bin() take the shortest way round. The direction settle delay is only
+    paid when the rotation direction actually changes.
+    """
+
+    def __init__(self, dir_pin=10, step_pin=8, steps_per_revolution=200, num_bins=4, pins=None,
+                 start_speed=100.0, max_speed=500.0, acceleration=2000.0):
         """Initialize the stepper motor with specified pins and steps per revolution"""
         self.dir_pin = dir_pin  # Direction pin
         self.step_pin = step_pin  # Step pin
         self.steps_per_revolution = steps_per_revolution  # Steps for a full 360-degree revolution
-        self.step_delay = 0.005  # Delay between steps (in seconds)
+        self.num_bins = num_bins  # Bins evenly spaced around the chute, bin 0 at position 0
+        self.start_speed = start_speed  # Speed the motor can start and stop at without ramping (steps/s)
+        self.max_speed = max_speed  # Cruise speed (steps/s)
+        self.acceleration = acceleration  # Ramp acceleration (steps/s^2)
         self.direction_switch_delay = 0.5  # Delay when switching direction (in seconds)
 
         # Constants for direction
@@ -17,10 +32,41 @@ class StepperMotor:
         # Calculate degrees per step
         self.degrees_per_step = 360.0 / self.steps_per_revolution  # e.g., 1.8 degrees per step for 200 steps
 
-        # Setup GPIO
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(self.dir_pin, GPIO.OUT)
-        GPIO.setup(self.step_pin, GPIO.OUT)
+        self.position = 0  # Current position in steps, 0 <= position < steps_per_revolution
+        self.direction = None  # Last direction driven, None until the first move
+
+        # Setup GPIO through the pin backend (pigpio waveforms, RPi.GPIO or the simulator)
+        self.pins = pins if pins is not None else default_backend()
+        self.pins.setup_output(self.dir_pin)
+        self.pins.setup_output(self.step_pin)
+
+    def ramp_delays(self, steps):
+        """Half-period delay of each step for a move of the given length (trapezoidal profile)"""
+        # 加速段所需步數：v^2 = v0^2 + 2an
+        accel_steps = int((self.max_speed ** 2 - self.start_speed ** 2) / (2 * self.acceleration))
+        accel_steps = min(accel_steps, steps // 2)
+        delays = []
+        for i in range(steps):
+            n = min(i, steps - 1 - i, accel_steps)
+            speed = min(math.sqrt(self.start_speed ** 2 + 2 * self.acceleration * n), self.max_speed)
+            delays.append(0.5 / speed)
+        return delays
+
+    def step(self, steps):
+        """Move by a signed number of steps. Positive for CW, negative for CCW"""
+        if steps == 0:
+            return
+        direction = self.CW if steps > 0 else self.CCW
+
+        # 方向未改變時不需等待馬達穩定
+        if direction != self.direction:
+            self.pins.write(self.dir_pin, direction)
+            if self.direction is not None:
+                self.pins.sleep(self.direction_switch_delay)  # Wait for the motor to stabilize after direction change
+            self.direction = direction
+
+        self.pins.pulse_train(self.step_pin, self.ramp_delays(abs(steps)))
+        self.position = (self.position + steps) % self.steps_per_revolution
 
     def rotate_angle(self, angle):
         """Rotate the motor by a specified angle (in degrees). Positive angle for CW, negative for CCW"""
@@ -30,28 +76,48 @@ class StepperMotor:
             print("Angle too small to move.")
             return
 
-        # Determine direction based on the sign of the angle
         direction = self.CW if angle >= 0 else self.CCW
+        print(f"Rotating {angle} degrees ({steps} steps) in {'CW' if direction == self.CW else 'CCW'} direction")
+        self.step(steps if direction == self.CW else -steps)
 
-        # Set the direction
-        GPIO.output(self.dir_pin, direction)
-        sleep(self.direction_switch_delay)  # Wait for the motor to stabilize after direction change
+    def bin_position(self, class_id):
+        """Absolute step position of the bin for class_id"""
+        return round(class_id * self.steps_per_revolution / self.num_bins) % self.steps_per_revolution
 
-        # Perform the steps
-        print(f"Rotating {angle} degrees ({steps} steps) in {'CW' if direction == self.CW else 'CCW'} direction")
-        for _ in range(steps):
-            GPIO.output(self.step_pin, GPIO.HIGH)
-            sleep(self.step_delay)
-            GPIO.output(self.step_pin, GPIO.LOW)
-            sleep(self.step_delay)
+    def move_to_bin(self, class_id):
+        """Turn the chute to the bin for class_id along the shorter way round; returns the signed step count"""
+        delta = (self.bin_position(class_id) - self.position) % self.steps_per_revolution
+        if delta > self.steps_per_revolution // 2:
+            delta -= self.steps_per_revolution
+        with metrics.span("motor_move"):
+            self.step(delta)
+        return delta
+
+    def move_time(self, steps):
+        """Time in seconds a move of the given length takes, excluding any direction settle delay"""
+        return 2 * sum(self.ramp_delays(abs(steps)))
 
     def cleanup(self):
         """Cleanup GPIO resources"""
         print("Cleaning up GPIO")
-        GPIO.cleanup()
+        self.pins.cleanup()
 
 # Example usage
 if __name__ == "__main__":
+    import sys
+
+    if "--sim" in sys.argv:
+        # 以模擬 GPIO 檢查各段移動的步數與時間
+        sim = SimulatedPins()
+        motor = StepperMotor(dir_pin=10, step_pin=8, steps_per_revolution=200, pins=sim)
+        for class_id in [2, 3, 0, 1, 1, 3]:
+            start = sim.now()
+            steps = motor.move_to_bin(class_id)
+            print(f"Bin {class_id}: {steps:+d} steps in {(sim.now() - start) * 1000:.1f} ms")
+        intervals = sim.step_intervals(motor.step_pin)
+        print(f"{len(sim.pulses(motor.step_pin))} steps, fastest step period {min(intervals) * 1000:.2f} ms")
+        sys.exit(0)
+
     try:
         # Initialize the stepper motor
         motor = StepperMotor(dir_pin=10, step_pin=8, steps_per_revolution=200)
@@ -68,4 +134,4 @@ if __name__ == "__main__":
         motor.cleanup()
     except Exception as e:
         print(f"An error occurred: {e}")
-        motor.cleanup()
\ No newline at end of file
+        motor.cleanup()
@@ -0,0 +1,345 @@
+"""Out-of-process ONNX inference, so classification does not compete with the web server for the GIL.
+
+InferencePool starts worker processes that each hold their own ONNXClassifier
+session. Frames are copied into slots of one multiprocessing.shared_memory
+block, and only a slot number and shape travel through the worker's stdin pipe.
+Each worker batches whatever requests are waiting and writes the softmax scores
+back on its stdout, together with the batch's preprocess and session_run times,
+which the pool reports to metrics (metrics are not collected in the workers). submit() returns a concurrent.futures.Future. Requests go
+to the worker with the fewest requests in flight.
+
+Workers are plain subprocesses running this file, not multiprocessing
+children, so the entry script (app.py) is not imported again in each worker.
+That matters on Windows, where it would open the camera a second time. A worker
+that dies fails its outstanding futures and is restarted; one that fails while
+starting (e.g. model.onnx is being replaced) is retried with exponential
+backoff. While no worker is running, submit() fails its future at once.
+
+The pool offers the classifier methods the entry points use: classify_frame,
+predict_frame, predict_scores, label, class_id and reload. It can therefore
+stand in for an ONNXClassifier behind CachedClassifier or TemporalVoter.
+"""
+import itertools
+import json
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+
+import numpy as np
+
+import metrics
+
+def _attach(name):
+    """Attach to an existing shared memory block without letting this process' resource tracker unlink it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class _Worker:
+    def __init__(self, index, process, failures=0):
+        self.index = index
+        self.process = process
+        self.failures = failures  # Consecutive start-up failures of this worker slot
+        self.send_lock = threading.Lock()
+        self.inflight = {}  # request_id -> (future, slot, submitted at)
+        self.ready = threading.Event()
+        self.alive = True
+        self.reload_future = None
+
+    def send(self, message):
+        """Write a message to the worker; returns False if its pipe is already closed"""
+        with self.send_lock:
+            try:
+                pickle.dump(message, self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                self.process.stdin.flush()
+                return True
+            except (OSError, ValueError):
+                return False
+
+class InferencePool:
+    def __init__(self, model_path, class_mapping=None, workers=None, session_config=None,
+                 frame_shape=(480, 640, 3), slots_per_worker=4, max_batch=4, start_timeout=60.0,
+                 result_timeout=30.0, restart_backoff_max=30.0):
+        """Pool of worker processes classifying frames of at most frame_shape bytes.
+
+        By default it leaves one core for the web server and splits the others between
+        the workers' intra-op threads.
+        """
+        cpu_count = os.cpu_count() or 2
+        self.model_path = os.path.abspath(model_path)
+        self.class_mapping = class_mapping
+        self.num_workers = workers or max(1, min(4, cpu_count - 1))
+        self.session_config = session_config if session_config is not None else {
+            "intra_op_num_threads": max(1, (cpu_count - 1) // self.num_workers)}
+        self.slot_bytes = int(np.prod(frame_shape))
+        self.num_slots = self.num_workers * slots_per_worker
+        self.max_batch = max_batch
+        self.start_timeout = start_timeout
+        self.result_timeout = result_timeout  # Longest classify_frame/predict_scores wait for a worker
+        self.restart_backoff_max = restart_backoff_max
+        self.free_slots = Queue()
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.workers = []
+        self.running = False
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def start(self):
+        """Create the shared frame slots and start the workers; returns once every worker has loaded the model"""
+        if self.running:
+            return
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.num_slots)
+        self.frames = np.ndarray((self.num_slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf)
+        for slot in range(self.num_slots):
+            self.free_slots.put(slot)
+        self.running = True
+        self.workers = [self._spawn(index) for index in range(self.num_workers)]
+        for worker in self.workers:
+            if not worker.ready.wait(self.start_timeout) or not worker.alive:
+                self.stop()
+                raise RuntimeError(f"Inference worker {worker.index} failed to start")
+        print(f"Inference pool started: {self.num_workers} workers, {self.session_config}")
+
+    def _spawn(self, index, failures=0):
+        config = {"model": self.model_path, "session_config": self.session_config, "shm": self.shm.name,
+                  "slots": self.num_slots, "slot_bytes": self.slot_bytes, "max_batch": self.max_batch}
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=os.getcwd())
+        worker = _Worker(index, process, failures)
+        reader = threading.Thread(target=self._read_loop, args=(worker,), name=f"inference-worker-{index}")
+        reader.daemon = True
+        reader.start()
+        return worker
+
+    def submit(self, frame, timeout=None):
+        """Queue one BGR frame; returns a Future for its softmax scores.
+
+        The frame is copied into shared memory before submit() returns. Blocks while
+        every slot is in use, raising queue.Empty after timeout seconds.
+        """
+        if not self.running:
+            raise RuntimeError("InferencePool is not running")
+        frame = np.asarray(frame)
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.shape} does not fit a {self.slot_bytes}-byte slot")
+        slot = self.free_slots.get(timeout=timeout)
+        np.copyto(self.frames[slot, :frame.nbytes], frame.reshape(-1))
+        future = Future()
+        request_id = next(self._ids)
+        with self.lock:
+            candidates = [worker for worker in self.workers if worker.alive]
+            if candidates:
+                worker = min(candidates, key=lambda w: len(w.inflight))
+                worker.inflight[request_id] = (future, slot, time.perf_counter())
+        if not candidates:
+            # 所有 worker 都在重啟中：立即失敗，不讓呼叫端無限等待
+            self.free_slots.put(slot)
+            self.failed += 1
+            future.set_exception(RuntimeError("No inference worker is running"))
+            return future
+        if not worker.send(("classify", request_id, slot, frame.shape)):
+            self._finish(worker, request_id, error=f"inference worker {worker.index} is not reachable")
+        return future
+
+    def _finish(self, worker, request_id, scores=None, error=None):
+        with self.lock:
+            entry = worker.inflight.pop(request_id, None)
+        if entry is None:
+            return
+        future, slot, submitted = entry
+        self.free_slots.put(slot)
+        if error is not None:
+            self.failed += 1
+            future.set_exception(RuntimeError(error))
+        else:
+            self.completed += 1
+            metrics.observe("pool_classify", time.perf_counter() - submitted)
+            future.set_result(scores)
+
+    def _read_loop(self, worker):
+        while True:
+            try:
+                message = pickle.load(worker.process.stdout)
+            except (EOFError, OSError, pickle.UnpicklingError):
+                break
+            kind = message[0]
+            if kind == "ready":
+                worker.ready.set()
+            elif kind == "scores":
+                for name, seconds in message[3].items():
+                    metrics.observe(name, seconds)
+                for request_id, scores in zip(message[1], message[2]):
+                    self._finish(worker, request_id, scores=scores)
+            elif kind == "error":
+                for request_id in message[1]:
+                    self._finish(worker, request_id, error=message[2])
+            elif kind == "reloaded" and worker.reload_future is not None:
+                worker.reload_future.set_result(message[1])
+        self._worker_exited(worker)
+
+    def _worker_exited(self, worker):
+        with self.lock:
+            worker.alive = False  # 之後 submit() 不會再把請求交給它
+        started = worker.ready.is_set()
+        worker.ready.set()
+        if worker.reload_future is not None and not worker.reload_future.done():
+            worker.reload_future.set_result(False)
+        for request_id in list(worker.inflight):
+            self._finish(worker, request_id, error=f"inference worker {worker.index} exited")
+        if self.running:
+            # 執行中意外結束的 worker 立即重啟；啟動就失敗的（例如模型檔暫時不存在）以指數退避重試
+            failures = 0 if started else worker.failures + 1
+            delay = min(self.restart_backoff_max, 0.5 * 2 ** (failures - 1)) if failures else 0.0
+            print(f"Inference worker {worker.index} exited with code {worker.process.wait()}, "
+                  f"restarting in {delay:.1f}s")
+            timer = threading.Timer(delay, self._restart, args=(worker.index, failures))
+            timer.daemon = True
+            timer.start()
+
+    def _restart(self, index, failures):
+        with self.lock:
+            if not self.running:
+                return
+            self.restarts += 1
+            self.workers[index] = self._spawn(index, failures)
+
+    def predict_scores(self, frames):
+        """Softmax probabilities, shape (len(frames), num_classes); frames are spread over the workers"""
+        futures = [self.submit(frame, timeout=self.result_timeout) for frame in frames]
+        return np.stack([future.result(self.result_timeout) for future in futures])
+
+    def classify_frame(self, frame):
+        """Return (class_id, confidence) for one BGR frame"""
+        scores = self.submit(frame, timeout=self.result_timeout).result(self.result_timeout)
+        class_id = int(np.argmax(scores))
+        return class_id, float(scores[class_id])
+
+    def predict_frame(self, frame):
+        return self.label(self.classify_frame(frame)[0])
+
+    def label(self, predicted_class):
+        """Map a class index to its label"""
+        if self.class_mapping:
+            return self.class_mapping.get(predicted_class, f"Class {predicted_class}")
+        return f"Class {predicted_class}"
+
+    def class_id(self, label):
+        """Map a label back to its class index (None if unknown)"""
+        for class_id, name in (self.class_mapping or {}).items():
+            if name == label:
+                return class_id
+        return None
+
+    def reload(self, timeout=60.0):
+        """Have every worker pick up a new model file; returns True if any of them changed"""
+        workers = [worker for worker in self.workers if worker.alive]
+        for worker in workers:
+            worker.reload_future = Future()
+            worker.send(("reload",))
+        return any([worker.reload_future.result(timeout) for worker in workers])
+
+    def stats(self):
+        with self.lock:
+            inflight = sum(len(worker.inflight) for worker in self.workers)
+            alive = sum(worker.alive for worker in self.workers)
+        return {"workers": alive, "completed": self.completed, "failed": self.failed,
+                "restarts": self.restarts, "inflight": inflight}
+
+    def stop(self):
+        """Stop the workers, fail requests still in flight and free the shared memory"""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False  # 之後排定的重啟不會再建立 worker
+        for worker in self.workers:
+            try:
+                worker.process.stdin.close()  # worker 讀到 EOF 後結束
+            except OSError:
+                pass
+        for worker in self.workers:
+            try:
+                worker.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()
+            worker.ready.wait(5)
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+def _worker_main(config):
+    """Worker process: classify frames from shared memory slots named on stdin, write scores to stdout"""
+    # 結果以 pickle 寫在 stdout，print 的輸出改到 stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    from ONNXClassifier import ONNXClassifier
+
+    def send(message):
+        pickle.dump(message, out, protocol=pickle.HIGHEST_PROTOCOL)
+        out.flush()
+
+    shm = _attach(config["shm"])
+    frames = np.ndarray((config["slots"], config["slot_bytes"]), dtype=np.uint8, buffer=shm.buf)
+    classifier = ONNXClassifier(config["model"], session_config=config["session_config"])
+    inbox = Queue()
+
+    def read_loop():
+        while True:
+            try:
+                inbox.put(pickle.load(sys.stdin.buffer))
+            except (EOFError, OSError, pickle.UnpicklingError):
+                inbox.put(None)
+                return
+
+    threading.Thread(target=read_loop, daemon=True).start()
+    send(("ready", os.getpid()))
+    running = True
+    while running:
+        messages = [inbox.get()]
+        # 已在等待的請求合併成一個批次推論
+        while len(messages) < config["max_batch"]:
+            try:
+                messages.append(inbox.get_nowait())
+            except Empty:
+                break
+        requests = []
+        for message in messages:
+            if message is None:
+                running = False
+            elif message[0] == "reload":
+                send(("reloaded", classifier.reload()))
+            elif message[0] == "classify":
+                requests.append(message[1:])
+        if not requests:
+            continue
+        request_ids = [request_id for request_id, _, _ in requests]
+        try:
+            batch = [frames[slot, :int(np.prod(shape))].reshape(shape) for _, slot, shape in requests]
+            # 與 ONNXClassifier.predict_scores 相同的步驟，分段計時後隨結果傳回主行程記錄
+            start = time.perf_counter()
+            image_tensor = classifier.preprocessor(batch)
+            preprocessed = time.perf_counter()
+            scores = classifier.scores_from_tensor(image_tensor)
+            timings = {"preprocess": preprocessed - start, "session_run": time.perf_counter() - preprocessed}
+            send(("scores", request_ids, list(scores), timings))
+        except Exception as e:
+            send(("error", request_ids, f"{type(e).__name__}: {e}"))
+    del frames
+    shm.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        _worker_main(json.loads(sys.argv[2]))
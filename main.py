@@ -1,98 +1,157 @@
 import threading
 import time
-import socket
-from queue import Queue
-import cv2
 import sys
 import keyboard
 from USBCamera import USBCamera
 from ONNXClassifier import ONNXClassifier
+from motion import MotionTrigger
+from voting import TemporalVoter
+from pipeline import SortingPipeline
+from phash_cache import PerceptualCache
+from archive import CaptureArchive
+import metrics
+import protocol
+from sorter_client import SorterConnection
 
 # Server 配置
 HOST = "192.168.12.98"  # 與你的client檔案一致
 PORT = 65432
 
 class MainApplication:
-    def __init__(self):
+    def __init__(self, save_captures=True, auto_trigger=False, temporal_voting=False, result_cache=False):
         # 初始化相機
         self.camera = USBCamera(camera_index=2)
         self.running = False
+        self.save_captures = save_captures  # 是否在送出預測後於背景存檔
+        # 自動模式：偵測到物品放入並靜止後自動分類，不需按 Enter
+        self.trigger = MotionTrigger(self.camera, self.process_trigger) if auto_trigger else None
         
         # 初始化ONNX模型
         class_mapping = {0: "bottle", 1: "glass_bottle", 2: "iron", 3: "paper"}
         self.classifier = ONNXClassifier("model.onnx", class_mapping)
+        # 多幀投票：連拍數張畫面合併判斷，信心足夠即提前結束
+        self.voter = TemporalVoter(self.classifier) if temporal_voting else None
+        # 前處理、推論、送出分別在各自的線程執行，下一個物品不必等上一個處理完
+        # --cache：畫面與前一次完全相同時（重複按鍵）直接沿用結果，不再推論
+        # 預設關閉：槽內背景不變，不同物品的雜湊可能相近而沿用到錯誤的結果
+        self.result_cache = PerceptualCache() if result_cache else None
+        self.pipeline = SortingPipeline(self.classifier, dispatch=self.dispatch_item, result_cache=self.result_cache)
         
-        # Socket客戶端
-        self.socket = None
-        self.connect_to_server()
+        # Socket客戶端：持續連線並自動重連，斷線期間的結果暫存在佇列中
+        self.sorter = SorterConnection(HOST, PORT, on_message=self.on_server_message)
         
-        # 用於保存圖片的隊列
-        self.save_queue = Queue()
+        # 背景編碼存檔，依日期分資料夾並記錄預測結果，超過容量或天數的舊檔自動刪除
+        self.archive = CaptureArchive("captures")
         
-    def connect_to_server(self):
-        """連接到server"""
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            print(f"Connecting to {HOST}:{PORT}...")
-            self.socket.connect((HOST, PORT))
-            print("Connected to server")
-        except Exception as e:
-            print(f"Failed to connect to server: {e}")
-            sys.exit(1)
+    def on_server_message(self, message):
+        """顯示server的回覆"""
+        print(f"Server: {protocol.describe(message)}")
 
-    def send_to_server(self, message):
-        """發送消息到server"""
-        try:
-            self.socket.sendall(message.encode('utf-8'))
-            print(f"Sent to server: {message}")
-        except Exception as e:
-            print(f"Error sending to server: {e}")
+    def send_to_server(self, class_id, confidence):
+        """將分類結果放入送出佇列（不會阻塞擷取線程）"""
+        request_id = self.sorter.send_classification(class_id, confidence)
+        print(f"Queued for server: #{request_id} class {class_id}")
+        return request_id
+
+    def process_trigger(self, lease):
+        """動作偵測到新物品：先清空結果快取，不沿用上一個物品的結果"""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        self.process_lease(lease)
+
+    def process_lease(self, lease):
+        """對一個畫面進行預測、送出結果並存檔"""
+        # 單幀模式交給 pipeline，不阻塞擷取線程
+        if not self.voter:
+            self.pipeline.submit(lease)
+            return
+
+        prediction, confidence, frames_used = self.voter.classify(self.camera, lease)
+        class_id = self.classifier.class_id(prediction)
+        print(f"Model prediction: {prediction} (confidence {confidence:.2f}, {frames_used} frames)")
+        request_id = self.send_to_server(class_id, confidence)
+        self.save_lease(lease, prediction, class_id, confidence, request_id)
+
+    def dispatch_item(self, item):
+        """pipeline 的送出階段：顯示並送出結果，畫面交給存檔線程"""
+        cached = " [cached]" if item.cached else ""
+        print(f"Model prediction: {item.label} (confidence {item.confidence:.2f}){cached}")
+        request_id = self.send_to_server(item.class_id, item.confidence)
+        metrics.annotate(item.id, request_id=request_id, label=item.label)
+        self.save_lease(item.lease, item.label, item.class_id, item.confidence, request_id,
+                        latency=time.perf_counter() - item.times["captured"])
+        item.lease = None
+
+    def save_lease(self, lease, label=None, class_id=None, confidence=None, request_id=None, latency=None):
+        """預測送出後再於背景存檔"""
+        if self.save_captures:
+            self.archive.submit(lease, label=label, class_id=class_id, confidence=confidence,
+                                latency=latency, request_id=request_id)
+        else:
+            lease.release()
 
     def capture_and_process(self):
         """處理圖片擷取和模型預測"""
         while self.running:
             if keyboard.is_pressed('enter'):
-                # 儲存當前畫面
-                timestamp = time.strftime("%Y%m%d_%H%M%S")
-                filename = f"capture_{timestamp}.jpg"
-                self.camera.request_save(filename)
-                
-                # 等待圖片保存完成
-                time.sleep(0.5)
+                # 取得當前畫面
+                lease = self.camera.lease_frame()
+                if lease is None:
+                    print("No frame available")
+                    time.sleep(0.5)
+                    continue
                 
-                # 使用模型進行預測
-                prediction = self.classifier.predict(filename)
-                print(f"Model prediction: {prediction}")
+                self.process_lease(lease)
                 
-                # 將結果發送到server
-                self.send_to_server(f"Prediction: {prediction}")
-                
-                # 防止連續觸發
-                time.sleep(0.5)
+                # 防止連續觸發：等放開按鍵，處理中的物品不會擋住下一次擷取
+                while self.running and keyboard.is_pressed('enter'):
+                    time.sleep(0.01)
             time.sleep(0.01)
 
     def start(self):
         """啟動應用程式"""
         self.running = True
         self.camera.start()
+        self.archive.start()
+        self.sorter.start()
+        self.pipeline.start()
         
-        # 啟動處理線程
-        process_thread = threading.Thread(target=self.capture_and_process)
-        process_thread.daemon = True
-        process_thread.start()
-        
-        print("Application started. Press Enter to capture and classify, Ctrl+C to exit")
+        if self.trigger:
+            # 啟動動作偵測
+            self.trigger.start()
+            print("Application started in auto-trigger mode, Ctrl+C to exit")
+        else:
+            # 啟動處理線程
+            process_thread = threading.Thread(target=self.capture_and_process)
+            process_thread.daemon = True
+            process_thread.start()
+            
+            print("Application started. Press Enter to capture and classify, Ctrl+C to exit")
 
     def stop(self):
         """停止應用程式"""
         self.running = False
+        if self.trigger:
+            self.trigger.stop()
+        self.pipeline.stop()
         self.camera.stop()
-        if self.socket:
-            self.socket.close()
-        print("Application stopped")
+        self.archive.stop()
+        self.sorter.stop()
+        print(f"Application stopped, pipeline stats: {self.pipeline.stats()}")
+        print(f"Sorter stats: {self.sorter.stats()}")
+        if self.result_cache is not None:
+            print(f"Result cache: {self.result_cache.stats()}")
+        print(f"Archive: {self.archive.stats()}")
+        if metrics.enabled:
+            print(metrics.summary())
 
 def main():
-    app = MainApplication()
+    if "--metrics" in sys.argv:
+        # 每 30 秒印出各階段延遲統計
+        metrics.enable()
+        metrics.start_dump()
+    app = MainApplication(auto_trigger="--auto" in sys.argv, temporal_voting="--vote" in sys.argv,
+                          result_cache="--cache" in sys.argv)
     try:
         app.start()
         while True:
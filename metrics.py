@@ -0,0 +1,183 @@
+"""Lightweight latency spans and histograms for the capture -> classify -> sort path.
+
+Instrumented code wraps work in ``with metrics.span("name", item_id):`` or
+reports a duration it measured itself with ``metrics.observe(...)``. Every span
+feeds a per-name histogram, and spans given an item ID are also collected into
+a per-item trace, so one item can be followed from capture to motor completion.
+On the client the item ID is the pipeline item or a new_item_id(); the server
+keys its spans by the protocol request ID, which annotate() links to the client item.
+
+Metrics are off unless enable() is called or SORTER_METRICS=1 is set; while
+disabled span() returns a shared no-op context manager and observe() returns
+immediately. prometheus_text() renders everything in the Prometheus text
+exposition format and summary() gives a compact table for headless CLI dumps.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_TRACES = 1000
+
+enabled = os.environ.get("SORTER_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_traces = OrderedDict()  # item_id -> {span name: (start, duration), "tags": {...}}
+_item_ids = itertools.count(1)
+
+class Histogram:
+    """Cumulative-bucket histogram in seconds, plus a window of recent samples for percentiles"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=1024)
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("name", "item_id", "start")
+
+    def __init__(self, name, item_id):
+        self.name = name
+        self.item_id = item_id
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.start, self.item_id, self.start)
+        return False
+
+def enable(on=True):
+    """Turn collection on (or off with on=False)"""
+    global enabled
+    enabled = on
+
+def new_item_id():
+    """A fresh process-local item ID for tracing"""
+    return next(_item_ids)
+
+def span(name, item_id=None):
+    """Context manager timing the enclosed block as span name, optionally in item_id's trace"""
+    if not enabled:
+        return _NOOP
+    return _Span(name, item_id)
+
+def observe(name, seconds, item_id=None, start=None):
+    """Record a duration measured elsewhere"""
+    if enabled:
+        _record(name, seconds, item_id, start)
+
+def _record(name, seconds, item_id, start):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+        if item_id is not None:
+            _trace(item_id)[name] = (start, seconds)
+
+def _trace(item_id):
+    trace = _traces.get(item_id)
+    if trace is None:
+        trace = _traces[item_id] = {}
+        if len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+    return trace
+
+def annotate(item_id, **tags):
+    """Attach tags such as request_id or label to an item's trace"""
+    if enabled:
+        with _lock:
+            _trace(item_id).setdefault("tags", {}).update(tags)
+
+def inc(name, amount=1):
+    """Increment a counter"""
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+def trace(item_id):
+    """Spans recorded for one item as {name: (start, duration)}, or None"""
+    with _lock:
+        trace = _traces.get(item_id)
+        return dict(trace) if trace is not None else None
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _traces.clear()
+
+def start_dump(interval=30.0):
+    """Print summary() every interval seconds from a daemon thread (CLI dump mode)"""
+    def dump_loop():
+        while True:
+            time.sleep(interval)
+            print(f"\n{summary()}")
+
+    thread = threading.Thread(target=dump_loop, name="metrics-dump")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def prometheus_text():
+    """All histograms and counters in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        if _histograms:
+            lines.append("# HELP sorter_span_seconds Duration of instrumented spans")
+            lines.append("# TYPE sorter_span_seconds histogram")
+            for name, histogram in sorted(_histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'sorter_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'sorter_span_seconds_sum{{span="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'sorter_span_seconds_count{{span="{name}"}} {histogram.count}')
+        if _counters:
+            lines.append("# HELP sorter_events_total Counted events")
+            lines.append("# TYPE sorter_events_total counter")
+            for name, value in sorted(_counters.items()):
+                lines.append(f'sorter_events_total{{event="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def summary():
+    """Human-readable table of span counts and latency percentiles in milliseconds"""
+    with _lock:
+        rows = [(name, histogram.count, np.array(histogram.recent) * 1000)
+                for name, histogram in sorted(_histograms.items())]
+        counters = sorted(_counters.items())
+    if not rows and not counters:
+        return "No metrics recorded" + ("" if enabled else " (metrics are disabled)")
+    lines = [f"{'span':<20}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+    for name, count, recent in rows:
+        lines.append(f"{name:<20}{count:>8}{recent.mean():>10.2f}{np.percentile(recent, 50):>10.2f}"
+                     f"{np.percentile(recent, 95):>10.2f}{recent.max():>10.2f}")
+    for name, value in counters:
+        lines.append(f"{name:<20}{value:>8}")
+    return "\n".join(lines)
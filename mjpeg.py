@@ -0,0 +1,89 @@
+import threading
+import cv2
+import numpy as np
+
+class MJPEGBroadcaster:
+    """Encode each new camera frame to JPEG once and fan the bytes out to every viewer.
+
+    Viewers always receive the most recent encoded frame, so a slow client simply
+    skips frames instead of holding up the encoder or other clients. Nothing is
+    encoded while no one is watching.
+    """
+
+    def __init__(self, camera, quality=80, size=None):
+        self.camera = camera
+        self.quality = quality
+        self.size = size  # (width, height) to downscale to before encoding, or None
+        self.running = False
+        self.viewers = 0
+        self.frames_encoded = 0
+        self.latest_seq = 0
+        self.latest_part = None
+        self.cond = threading.Condition()
+        self._resized = None
+
+    def start(self):
+        """Start the encoder thread (safe to call more than once)"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.encoder_thread = threading.Thread(target=self._encode_loop)
+        self.encoder_thread.daemon = True
+        self.encoder_thread.start()
+
+    def _encode(self, frame):
+        if self.size is not None:
+            if self._resized is None:
+                self._resized = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+            frame = cv2.resize(frame, self.size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+    def _encode_loop(self):
+        seq = 0
+        while self.running:
+            with self.cond:
+                # 沒有觀看者時不編碼
+                self.cond.wait_for(lambda: self.viewers > 0 or not self.running)
+            if not self.running:
+                break
+            lease = self.camera.lease_frame(seq, timeout=1.0)
+            if lease is None:
+                continue
+            with lease:
+                seq = lease.seq
+                part = self._encode(lease.frame)
+            with self.cond:
+                self.latest_seq = seq
+                self.latest_part = part
+                self.frames_encoded += 1
+                self.cond.notify_all()
+
+    def stream(self):
+        """Generator of multipart MJPEG chunks for one viewer"""
+        with self.cond:
+            self.viewers += 1
+            self.cond.notify_all()
+        try:
+            last_seq = 0
+            while self.running:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.latest_seq > last_seq or not self.running, 1.0):
+                        continue
+                    if not self.running:
+                        break
+                    last_seq, part = self.latest_seq, self.latest_part
+                yield part
+        finally:
+            with self.cond:
+                self.viewers -= 1
+
+    def stop(self):
+        """Stop the encoder thread and end all streams"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if hasattr(self, "encoder_thread"):
+            self.encoder_thread.join()
@@ -1,10 +1,13 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torchvision import datasets, transforms, models
+from torchvision import transforms, models
 from torch.utils.data import DataLoader
 import onnx
-import onnxruntime
+import os
+from ort_session import get_session
+from dataset_cache import DEFAULT_CACHE_DIR, CachedImageDataset, build_cache
+from preprocess import IMAGENET_MEAN, IMAGENET_STD
 
 class Classifier:
     def __init__(self, num_classes=4, device=None):
@@ -12,24 +15,35 @@ class Classifier:
         self.model = self._build_model(num_classes)
         self.model.to(self.device)
         self.train_dataset = None  # 儲存 train_dataset 以便後續使用
+        # 正規化在訓練裝置上進行，DataLoader 只需搬移 uint8 影像
+        self._mean = torch.tensor(IMAGENET_MEAN, device=self.device).view(1, 3, 1, 1)
+        self._std = torch.tensor(IMAGENET_STD, device=self.device).view(1, 3, 1, 1)
 
     def _build_model(self, num_classes):
         model = models.resnet18(pretrained=True)
         model.fc = nn.Linear(model.fc.in_features, num_classes)
         return model
 
-    def train(self, train_dir, val_dir, epochs=10, batch_size=32, lr=0.001):
-        transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ])
+    def _loader(self, dataset, batch_size, shuffle, num_workers):
+        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                          pin_memory=str(self.device).startswith("cuda"), persistent_workers=num_workers > 0)
+
+    def _to_input(self, images):
+        """uint8 NHWC batch from the cached loader -> normalized float NCHW on the training device"""
+        images = images.to(self.device, non_blocking=True).permute(0, 3, 1, 2).float().div_(255)
+        return images.sub_(self._mean).div_(self._std)
 
-        self.train_dataset = datasets.ImageFolder(train_dir, transform=transform)
-        val_dataset = datasets.ImageFolder(val_dir, transform=transform)
+    def train(self, train_dir, val_dir, epochs=10, batch_size=32, lr=0.001, cache_dir=DEFAULT_CACHE_DIR,
+              num_workers=None, augment=True):
+        # 圖片只在第一次解碼並縮放後存入快取，之後每個 epoch 直接讀取記憶體映射的陣列
+        if num_workers is None:
+            num_workers = min(4, os.cpu_count() or 1)
+        self.train_dataset = CachedImageDataset(build_cache(train_dir, cache_dir, size=(256, 256)),
+                                                augment=augment)
+        val_dataset = CachedImageDataset(build_cache(val_dir, cache_dir, size=(224, 224)))
 
-        train_loader = DataLoader(self.train_dataset, batch_size=batch_size, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+        train_loader = self._loader(self.train_dataset, batch_size, True, num_workers)
+        val_loader = self._loader(val_dataset, batch_size, False, num_workers)
 
         criterion = nn.CrossEntropyLoss()
         optimizer = optim.Adam(self.model.parameters(), lr=lr)
@@ -38,7 +52,7 @@ class Classifier:
             self.model.train()
             running_loss = 0.0
             for inputs, labels in train_loader:
-                inputs, labels = inputs.to(self.device), labels.to(self.device)
+                inputs, labels = self._to_input(inputs), labels.to(self.device, non_blocking=True)
                 optimizer.zero_grad()
                 outputs = self.model(inputs)
                 loss = criterion(outputs, labels)
@@ -55,7 +69,7 @@ class Classifier:
         total = 0
         with torch.no_grad():
             for inputs, labels in val_loader:
-                inputs, labels = inputs.to(self.device), labels.to(self.device)
+                inputs, labels = self._to_input(inputs), labels.to(self.device, non_blocking=True)
                 outputs = self.model(inputs)
                 _, preds = torch.max(outputs, 1)
                 correct += (preds == labels).sum().item()
@@ -93,8 +107,11 @@ class Classifier:
         self.model.to(self.device)
         print(f"Model loaded from {file_path}")
 
-    def export_to_onnx(self, onnx_path, input_size=(1, 3, 224, 224)):
+    def export_to_onnx(self, onnx_path, input_size=(1, 3, 224, 224), dynamic_batch=True):
+        self.model.eval()
         dummy_input = torch.randn(*input_size).to(self.device)
+        # 動態 batch 維度讓 ONNXClassifier 能一次推論多張畫面
+        dynamic_axes = {'input': {0: 'batch'}, 'output': {0: 'batch'}} if dynamic_batch else None
         torch.onnx.export(
             self.model, 
             dummy_input, 
@@ -102,7 +119,8 @@ class Classifier:
             export_params=True, 
             opset_version=11, 
             input_names=['input'], 
-            output_names=['output']
+            output_names=['output'],
+            dynamic_axes=dynamic_axes
         )
         print(f"Model exported to {onnx_path}")
 
@@ -116,8 +134,8 @@ class Classifier:
         image = Image.open(image_path).convert("RGB")
         input_tensor = transform(image).unsqueeze(0).numpy()
 
-        # 使用 ONNX Runtime 進行推論
-        ort_session = onnxruntime.InferenceSession(onnx_path)
+        # 使用 ONNX Runtime 進行推論（session 建立一次後重複使用）
+        ort_session = get_session(onnx_path)
         ort_inputs = {ort_session.get_inputs()[0].name: input_tensor}
         ort_outs = ort_session.run(None, ort_inputs)
         prediction = ort_outs[0].argmax(axis=1)[0]
@@ -126,8 +144,10 @@ class Classifier:
         return idx_to_class[prediction] if idx_to_class else prediction
 
 # 使用方式
-classifier = Classifier(num_classes=4)
-# classifier.train(train_dir="path_to_train", val_dir="path_to_val", epochs=10)
-# classifier.export_to_onnx("model.onnx")
-result = classifier.onnx_inference("model.onnx", "path_to_image")
-print("Predicted label:", result)
+if __name__ == "__main__":
+    classifier = Classifier(num_classes=4)
+    # classifier.train(train_dir="path_to_train", val_dir="path_to_val", epochs=10)
+    # classifier.export_to_onnx("model.onnx")
+    result = classifier.onnx_inference("model.onnx", "path_to_image")
+    print("Predicted label:", result)
+
@@ -0,0 +1,125 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+class MotionTrigger:
+    """Fire a callback once per item dropped into the chute, using cheap low-resolution frame differencing.
+
+    The detector compares a small grayscale copy of each frame against a slowly
+    updated background of the empty chute. When enough pixels change an item has
+    arrived; once consecutive frames stop changing the scene has settled and
+    on_item(lease) is called with a FrameLease of that frame (the callback must
+    release it). The trigger then waits for the chute to empty again before
+    re-arming, so each item is classified exactly once.
+    """
+
+    IDLE, ACTIVE, WAIT_CLEAR = "idle", "active", "wait_clear"
+
+    def __init__(self, camera, on_item, detect_fps=10, size=(80, 60), pixel_threshold=25,
+                 enter_fraction=0.02, settle_fraction=0.005, settle_frames=3,
+                 background_rate=0.05, max_active_seconds=5.0, clear_timeout=30.0):
+        self.camera = camera
+        self.on_item = on_item
+        self.detect_interval = 1.0 / detect_fps
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.enter_fraction = enter_fraction  # Share of pixels differing from the background that means "item present"
+        self.settle_fraction = settle_fraction  # Share of pixels changing between frames that still counts as "still"
+        self.settle_frames = settle_frames
+        self.background_rate = background_rate
+        self.max_active_seconds = max_active_seconds
+        self.clear_timeout = clear_timeout
+        self.running = False
+        self.state = self.IDLE
+        self.triggers = 0
+        self.background = None
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._previous = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._diff = np.empty((size[1], size[0]), dtype=np.uint8)
+
+    def start(self):
+        """Start the detector thread"""
+        if not self.running:
+            self.running = True
+            self.detect_thread = threading.Thread(target=self._detect_loop)
+            self.detect_thread.daemon = True
+            self.detect_thread.start()
+            print("Motion trigger started")
+
+    def _changed_fraction(self, a, b):
+        cv2.absdiff(a, b, dst=self._diff)
+        return np.count_nonzero(self._diff > self.pixel_threshold) / self._diff.size
+
+    def _detect_loop(self):
+        seq = 0
+        still_frames = 0
+        active_since = 0.0
+        fired_at = 0.0
+        while self.running:
+            lease = self.camera.lease_frame(seq, timeout=1.0)
+            if lease is None:
+                continue
+            seq = lease.seq
+            cv2.resize(lease.frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            cv2.GaussianBlur(self._gray, (5, 5), 0, dst=self._gray)
+
+            if self.background is None:
+                self.background = self._gray.astype(np.float32)
+                np.copyto(self._previous, self._gray)
+                lease.release()
+                continue
+
+            background = cv2.convertScaleAbs(self.background)
+            presence = self._changed_fraction(self._gray, background)
+            motion = self._changed_fraction(self._gray, self._previous)
+            np.copyto(self._previous, self._gray)
+            fire = False
+
+            if self.state == self.IDLE:
+                if presence >= self.enter_fraction:
+                    self.state = self.ACTIVE
+                    still_frames = 0
+                    active_since = time.monotonic()
+                else:
+                    # 只在空槽時更新背景，適應光線的緩慢變化
+                    cv2.accumulateWeighted(self._gray, self.background, self.background_rate)
+            elif self.state == self.ACTIVE:
+                still_frames = still_frames + 1 if motion < self.settle_fraction else 0
+                if presence < self.enter_fraction:
+                    self.state = self.IDLE  # Item left before settling (e.g. fell straight through)
+                elif still_frames >= self.settle_frames:
+                    fire = True
+                    fired_at = time.monotonic()
+                    self.state = self.WAIT_CLEAR
+                elif time.monotonic() - active_since > self.max_active_seconds:
+                    # 場景長時間不穩定，視為背景改變並重新學習
+                    self.background = self._gray.astype(np.float32)
+                    self.state = self.IDLE
+            elif self.state == self.WAIT_CLEAR:
+                if presence < self.enter_fraction:
+                    self.state = self.IDLE
+                elif time.monotonic() - fired_at > self.clear_timeout:
+                    # 物品一直未離開或光線改變，以目前畫面作為新背景
+                    self.background = self._gray.astype(np.float32)
+                    self.state = self.IDLE
+
+            if fire:
+                self.triggers += 1
+                try:
+                    self.on_item(lease)
+                except Exception as e:
+                    lease.release()
+                    print(f"Motion trigger callback failed: {e}")
+            else:
+                lease.release()
+            time.sleep(self.detect_interval)
+
+    def stop(self):
+        """Stop the detector thread"""
+        self.running = False
+        if hasattr(self, "detect_thread"):
+            self.detect_thread.join()
+        print("Motion trigger stopped")
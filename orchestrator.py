@@ -0,0 +1,214 @@
+"""Run several sorting lanes (camera + chute + sorter connection) in one process.
+
+Every lane has its own camera, motion trigger and SorterConnection (its HELLO
+carries the lane name, so the server drives that lane's motor), but all lanes
+share one ONNX session and one SortingPipeline: frames from different chutes
+are preprocessed by the same worker and batched together for inference, and a
+shared CaptureArchive stores them with their lane. An extra lane therefore
+costs a frame ring, a few threads and a socket instead of another Python
+process with its own copy of the model.
+
+The lanes come from a JSON config (see lanes.example.json):
+
+    {
+      "model": "model.onnx",
+      "classes": {"0": "bottle", "1": "glass_bottle", "2": "iron", "3": "paper"},
+      "server": {"host": "192.168.12.98", "port": 65432},
+      "lanes": [
+        {"name": "left", "camera_index": 0},
+        {"name": "right", "camera_index": 2, "server": {"host": "192.168.12.99"}}
+      ]
+    }
+
+A lane with "source": "synthetic" plays training images instead of opening a
+camera (see synthetic_camera.py), which allows trying a config off the Pi.
+"result_cache": true (or a dict of PerceptualCache options such as "roi")
+enables the shared perceptual result cache; it is off by default and cleared
+whenever any lane's motion trigger fires.
+
+    python orchestrator.py --config lanes.json [--metrics] [--stats-interval 30]
+"""
+import argparse
+import json
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+import metrics
+import protocol
+from ONNXClassifier import ONNXClassifier
+from USBCamera import USBCamera
+from archive import CaptureArchive
+from motion import MotionTrigger
+from phash_cache import PerceptualCache
+from pipeline import SortingPipeline
+from sorter_client import SorterConnection
+
+class Lane:
+    """One chute: camera, motion trigger, sorter connection and its counters"""
+
+    def __init__(self, name, camera, sorter, submit, trigger_options=None):
+        self.name = name
+        self.camera = camera
+        self.sorter = sorter
+        self.trigger = MotionTrigger(camera, lambda lease: submit(lease, lane=self), **(trigger_options or {}))
+        self.items = 0
+        self.cached = 0
+        self.labels = Counter()
+        self.confidence_sum = 0.0
+        self.latencies = deque(maxlen=1000)  # capture -> dispatch, seconds
+
+    def start(self):
+        self.camera.start()
+        self.sorter.start()
+        self.trigger.start()
+
+    def record(self, item):
+        self.items += 1
+        self.cached += item.cached
+        self.labels[item.label] += 1
+        self.confidence_sum += item.confidence
+        self.latencies.append(time.perf_counter() - item.times["captured"])
+
+    def stats(self, elapsed):
+        stats = {
+            "items": self.items,
+            "items_per_min": self.items / elapsed * 60 if elapsed else 0.0,
+            "cached": self.cached,
+            "labels": dict(self.labels),
+            "mean_confidence": self.confidence_sum / self.items if self.items else 0.0,
+            "camera_fps": self.camera.frame_seq / elapsed if elapsed else 0.0,
+            "triggers": self.trigger.triggers,
+            "sorter": self.sorter.stats(),
+        }
+        if self.latencies:
+            stats["latency_ms_p50"] = float(np.percentile(self.latencies, 50)) * 1000
+            stats["latency_ms_p99"] = float(np.percentile(self.latencies, 99)) * 1000
+        return stats
+
+class Orchestrator:
+    def __init__(self, config):
+        """Build the shared classifier, pipeline and archive and one Lane per config entry"""
+        class_mapping = {int(k): v for k, v in config["classes"].items()} if "classes" in config else None
+        self.classifier = ONNXClassifier(config.get("model", "model.onnx"), class_mapping,
+                                         session_config=config.get("session"))
+        cache_config = config.get("result_cache")
+        self.result_cache = None
+        if cache_config:
+            self.result_cache = PerceptualCache(**(cache_config if isinstance(cache_config, dict) else {}))
+        # 所有 lane 共用同一個 pipeline：推論階段會把不同 lane 的畫面合併成一個批次
+        self.pipeline = SortingPipeline(self.classifier, dispatch=self.dispatch_item,
+                                        max_batch=max(4, len(config["lanes"])), result_cache=self.result_cache)
+        self.archive = CaptureArchive(config["archive"]) if config.get("archive") else None
+        self.lanes = []
+        server = config.get("server", {})
+        for lane_config in config["lanes"]:
+            name = lane_config["name"]
+            lane_server = dict(server, **lane_config.get("server", {}))
+            sorter = SorterConnection(lane_server.get("host", "127.0.0.1"), lane_server.get("port", 65432),
+                                      lane=name, on_message=lambda message, name=name: self.on_server_message(name, message))
+            self.lanes.append(Lane(name, self._camera(lane_config), sorter, self.submit,
+                                   lane_config.get("trigger")))
+        self.started_at = None
+
+    @staticmethod
+    def _camera(lane_config):
+        if lane_config.get("source") == "synthetic":
+            from synthetic_camera import SyntheticCamera
+            return SyntheticCamera(lane_config.get("image_root", "training_image"), fps=lane_config.get("fps", 30),
+                                   seed=lane_config.get("seed", 0))
+        return USBCamera(camera_index=lane_config.get("camera_index", 0), fps=lane_config.get("fps", 30))
+
+    def submit(self, lease, lane):
+        """Motion trigger callback: a new item arrived in the lane's chute"""
+        # 新物品不可沿用任何 lane 上一個物品的快取結果
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        self.pipeline.submit(lease, lane=lane)
+
+    def on_server_message(self, lane_name, message):
+        if message.msg_type != protocol.ACK:
+            print(f"[{lane_name}] Server: {protocol.describe(message)}")
+
+    def dispatch_item(self, item):
+        """pipeline 的送出階段：依 lane 送到對應的 sorter 連線並存檔"""
+        lane = item.lane
+        request_id = lane.sorter.send_classification(item.class_id, item.confidence)
+        lane.record(item)
+        metrics.annotate(item.id, request_id=request_id, label=item.label, lane=lane.name)
+        print(f"[{lane.name}] {item.label} (confidence {item.confidence:.2f}){' [cached]' if item.cached else ''}")
+        if self.archive is not None:
+            self.archive.submit(item.lease, label=item.label, class_id=item.class_id, confidence=item.confidence,
+                                latency=time.perf_counter() - item.times["captured"], request_id=request_id,
+                                lane=lane.name)
+            item.lease = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        if self.archive is not None:
+            self.archive.start()
+        self.pipeline.start()
+        for lane in self.lanes:
+            lane.start()
+        print(f"Orchestrator started with {len(self.lanes)} lanes: {', '.join(lane.name for lane in self.lanes)}")
+
+    def stats(self):
+        """Per-lane counters plus the shared pipeline, cache and archive"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        stats = {"uptime_s": elapsed, "lanes": {lane.name: lane.stats(elapsed) for lane in self.lanes},
+                 "pipeline": self.pipeline.stats()}
+        if self.result_cache is not None:
+            stats["result_cache"] = self.result_cache.stats()
+        if self.archive is not None:
+            stats["archive"] = self.archive.stats()
+        return stats
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"\n{'lane':<12} {'items':>6} {'/min':>6} {'cached':>6} {'conf':>5} {'p50 ms':>7} {'fps':>5} "
+              f"{'acked':>6} {'queued':>6} connected")
+        for name, lane in stats["lanes"].items():
+            sorter = lane["sorter"]
+            print(f"{name:<12} {lane['items']:>6} {lane['items_per_min']:>6.1f} {lane['cached']:>6} "
+                  f"{lane['mean_confidence']:>5.2f} {lane.get('latency_ms_p50', 0.0):>7.1f} {lane['camera_fps']:>5.1f} "
+                  f"{sorter['acked']:>6} {sorter['queue_depth']:>6} {sorter['connected']}")
+        infer = stats["pipeline"]["infer"]
+        print(f"Shared inference: {infer['processed']} items, {infer['busy_ms_per_item']:.1f} ms/item; "
+              f"result cache {stats.get('result_cache', 'off')}")
+
+    def stop(self):
+        for lane in self.lanes:
+            lane.trigger.stop()
+        self.pipeline.stop()
+        for lane in self.lanes:
+            lane.camera.stop()
+            lane.sorter.stop()
+        if self.archive is not None:
+            self.archive.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default="lanes.json")
+    parser.add_argument("--stats-interval", type=float, default=30.0, help="seconds between per-lane stats tables")
+    parser.add_argument("--metrics", action="store_true", help="collect latency spans and dump them periodically")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+        metrics.start_dump()
+    with open(args.config) as f:
+        orchestrator = Orchestrator(json.load(f))
+    orchestrator.start()
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            orchestrator.print_stats()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        orchestrator.stop()
+        orchestrator.print_stats()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import platform
+import threading
+import onnxruntime
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+DEFAULT_CACHE_DIR = ".ort_cache"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def resolve_providers(providers=None):
+    """Keep the requested execution providers that this onnxruntime build supports, in order"""
+    available = onnxruntime.get_available_providers()
+    if providers is None:
+        return available
+    selected = [p for p in providers if p in available]
+    missing = [p for p in providers if p not in available]
+    if missing:
+        print(f"Execution providers not available, skipping: {', '.join(missing)}")
+    return selected or ["CPUExecutionProvider"]
+
+def build_session_options(graph_optimization_level="all", intra_op_num_threads=0,
+                          inter_op_num_threads=0, execution_mode="sequential",
+                          enable_cpu_mem_arena=True, enable_mem_pattern=True):
+    """Build onnxruntime.SessionOptions from plain settings (0 threads = onnxruntime default)"""
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = inter_op_num_threads
+    options.execution_mode = EXECUTION_MODES[execution_mode]
+    options.enable_cpu_mem_arena = enable_cpu_mem_arena
+    options.enable_mem_pattern = enable_mem_pattern
+    return options
+
+def _optimized_model_path(model_path, graph_optimization_level, providers, cache_dir):
+    # 以原始模型的大小與修改時間、最佳化等級、provider 與 onnxruntime 版本決定快取檔名，
+    # 模型或環境更新後自動失效（"all" 等級的最佳化結果與硬體相關，快取只供本機使用）
+    stat = os.stat(model_path)
+    key = (f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{graph_optimization_level}|"
+           f"{','.join(providers)}|{onnxruntime.__version__}|{platform.machine()}")
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{stem}.{graph_optimization_level}.{digest}.onnx")
+
+def create_session(model_path, providers=None, cache_dir=DEFAULT_CACHE_DIR, **settings):
+    """Create a new InferenceSession, loading a previously optimized copy from cache_dir if present"""
+    providers = resolve_providers(providers)
+    level = settings.get("graph_optimization_level", "all")
+    options = build_session_options(**settings)
+    if cache_dir and level != "disable":
+        cached_path = _optimized_model_path(model_path, level, providers, cache_dir)
+        if os.path.exists(cached_path):
+            # 已最佳化過的模型不需再做圖最佳化
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+            return onnxruntime.InferenceSession(cached_path, sess_options=options, providers=providers)
+        os.makedirs(cache_dir, exist_ok=True)
+        options.optimized_model_filepath = cached_path
+    return onnxruntime.InferenceSession(model_path, sess_options=options, providers=providers)
+
+def get_session(model_path, providers=None, cache_dir=DEFAULT_CACHE_DIR, **settings):
+    """Return the shared InferenceSession for this model file and configuration, creating it once.
+
+    Settings are the keyword arguments of build_session_options. A session is
+    re-created when the model file on disk changes.
+    """
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), tuple(providers) if providers else None, cache_dir,
+           tuple(sorted(settings.items())))
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _sessions_lock:
+        cached = _sessions.get(key)
+        if cached is None or cached[0] != version:
+            session = create_session(model_path, providers=providers, cache_dir=cache_dir, **settings)
+            _sessions[key] = (version, session)
+            return session
+        return cached[1]
+
+def clear_sessions():
+    """Drop all shared sessions (they are freed once no classifier holds them)"""
+    with _sessions_lock:
+        _sessions.clear()
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+import metrics
+
+def dhash(frame, hash_size=16):
+    """Difference hash of a BGR frame as a (hash_size * hash_size)-bit int.
+
+    The frame is subsampled, area-averaged down to (hash_size + 1) x hash_size
+    grayscale cells and each bit records whether a cell is brighter than its
+    right-hand neighbour. Small sensor noise and exposure drift leave the hash
+    (nearly) unchanged; a different object in the chute flips many bits.
+    """
+    small = cv2.resize(frame[::4, ::4], (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class PerceptualCache:
+    """Bounded LRU map from frame hashes to classification results.
+
+    get() returns the result stored for any hash within max_distance bits that is
+    younger than ttl seconds, so a repeated capture of an unchanged scene (button
+    pressed twice) skips inference. The static chute background dominates a hash of
+    the whole frame, so different items can hash alike: roi=(x, y, width, height)
+    restricts the hash to the part of the frame where items lie, max_distance
+    defaults to exact matches, and clear() must be called whenever a new item
+    arrives (e.g. on every motion trigger). Keys are tagged with a generation, so
+    a result computed before a clear() is never stored after it. Hit and miss
+    counts are kept here and reported to metrics as phash_hit / phash_miss.
+    """
+
+    def __init__(self, max_entries=64, max_distance=0, ttl=10.0, hash_size=16, roi=None):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hash_size = hash_size
+        self.roi = roi
+        self.entries = OrderedDict()  # hash -> (result, stored at)
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, frame):
+        """(generation, hash) of the frame's region of interest"""
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            frame = frame[y:y + height, x:x + width]
+        return self.generation, dhash(frame, self.hash_size)
+
+    def get(self, key):
+        """Cached result for a key (or a near-identical one of the same generation), or None"""
+        generation, key = key
+        now = time.monotonic()
+        with self.lock:
+            best, best_distance = None, self.max_distance + 1
+            # 在 clear() 之前算出的 key 一律視為未命中
+            entries = list(self.entries.items()) if generation == self.generation else []
+            for stored_key, (result, stored_at) in entries:
+                if now - stored_at > self.ttl:
+                    del self.entries[stored_key]
+                    continue
+                distance = hamming(key, stored_key)
+                if distance < best_distance:
+                    best, best_distance = stored_key, distance
+                    if distance == 0:
+                        break
+            if best is None:
+                self.misses += 1
+                metrics.inc("phash_miss")
+                return None
+            self.entries.move_to_end(best)
+            self.hits += 1
+            metrics.inc("phash_hit")
+            return self.entries[best][0]
+
+    def put(self, key, result):
+        generation, key = key
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (result, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every result, including those of lookups still in progress"""
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+class CachedClassifier:
+    """ONNXClassifier wrapper that answers near-duplicate frames from a PerceptualCache.
+
+    classify_frame() and predict_frame() consult the cache; everything else is
+    passed through to the wrapped classifier. The cache is cleared when the model
+    is reloaded.
+    """
+
+    def __init__(self, classifier, cache=None):
+        self.classifier = classifier
+        self.cache = cache if cache is not None else PerceptualCache()
+
+    def classify_frame(self, frame):
+        """Return (class_id, confidence) for one BGR frame"""
+        key = self.cache.key(frame)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.classifier.classify_frame(frame)
+            self.cache.put(key, result)
+        return result
+
+    def predict_frame(self, frame):
+        return self.classifier.label(self.classify_frame(frame)[0])
+
+    def reload(self):
+        changed = self.classifier.reload()
+        if changed:
+            self.cache.clear()
+        return changed
+
+    def __getattr__(self, name):
+        return getattr(self.classifier, name)
@@ -0,0 +1,201 @@
+"""Pin backends for driving the stepper motors.
+
+Every backend takes physical (BOARD) pin numbers and offers the small interface
+used by gpio.StepperMotor:
+
+    setup_output(pin), write(pin, value), pulse_train(pin, half_periods),
+    sleep(seconds), cleanup()
+
+pulse_train() drives the pin HIGH then LOW for each half-period in the list and
+returns once the whole train has been sent. RPiGPIOBackend bit-bangs it from
+Python, PigpioBackend hands it to the pigpio daemon as a DMA-timed waveform so
+Python scheduling jitter no longer limits the step rate, and SimulatedPins
+records every edge with its timestamp so the motor code can be tested and the
+full sort cycle benchmarked on a machine without GPIO.
+"""
+import threading
+import time
+
+# Physical header pin -> Broadcom GPIO number (40-pin header)
+BOARD_TO_BCM = {
+    3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23, 18: 24, 19: 10,
+    21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12, 33: 13, 35: 19,
+    36: 16, 37: 26, 38: 20, 40: 21,
+}
+
+def sleep_until(deadline):
+    """Sleep until perf_counter() reaches deadline, spinning for the last millisecond"""
+    remaining = deadline - time.perf_counter()
+    if remaining > 0.002:
+        time.sleep(remaining - 0.001)
+    while time.perf_counter() < deadline:
+        pass
+
+class RPiGPIOBackend:
+    """RPi.GPIO backend; pulse trains are timed in Python against absolute deadlines"""
+
+    name = "rpi"
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BOARD)
+
+    def setup_output(self, pin):
+        self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def write(self, pin, value):
+        self.GPIO.output(pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+
+    def pulse_train(self, pin, half_periods):
+        # 以絕對時間排程，單步 sleep 的誤差不會累積
+        deadline = time.perf_counter()
+        for delay in half_periods:
+            self.GPIO.output(pin, self.GPIO.HIGH)
+            deadline += delay
+            sleep_until(deadline)
+            self.GPIO.output(pin, self.GPIO.LOW)
+            deadline += delay
+            sleep_until(deadline)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+class PigpioBackend:
+    """pigpio backend; pulse trains are sent as hardware-timed waveforms by the pigpio daemon.
+
+    The daemon transmits one waveform at a time, so trains of several motors
+    sharing this backend are sent one after another.
+    """
+
+    name = "pigpio"
+    MAX_PULSES_PER_WAVE = 2000
+
+    def __init__(self, host="localhost", port=8888):
+        import pigpio
+        self.pigpio = pigpio
+        self.pi = pigpio.pi(host, port)
+        if not self.pi.connected:
+            raise RuntimeError(f"pigpio daemon not reachable at {host}:{port} (start it with 'sudo pigpiod')")
+        self.wave_lock = threading.Lock()
+
+    def setup_output(self, pin):
+        self.pi.set_mode(BOARD_TO_BCM[pin], self.pigpio.OUTPUT)
+
+    def write(self, pin, value):
+        self.pi.write(BOARD_TO_BCM[pin], 1 if value else 0)
+
+    def pulse_train(self, pin, half_periods):
+        mask = 1 << BOARD_TO_BCM[pin]
+        pulses = []
+        for delay in half_periods:
+            micros = max(1, round(delay * 1e6))
+            pulses.append(self.pigpio.pulse(mask, 0, micros))
+            pulses.append(self.pigpio.pulse(0, mask, micros))
+        with self.wave_lock:
+            waves = []
+            try:
+                # 長的脈衝串分成多個 waveform，以 wave_chain 無間隙接續送出
+                for start in range(0, len(pulses), self.MAX_PULSES_PER_WAVE):
+                    self.pi.wave_add_generic(pulses[start:start + self.MAX_PULSES_PER_WAVE])
+                    waves.append(self.pi.wave_create())
+                self.pi.wave_chain(waves)
+                while self.pi.wave_tx_busy():
+                    time.sleep(0.001)
+            finally:
+                for wave in waves:
+                    self.pi.wave_delete(wave)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def cleanup(self):
+        self.pi.stop()
+
+class SimulatedPins:
+    """In-process backend that records (time, pin, value) for every edge.
+
+    With realtime=False the clock is virtual and sleep() advances it instantly,
+    so a move is replayed in microseconds. With realtime=True pulse trains and
+    sleeps take their real duration, like a hardware waveform would, which lets
+    the camera -> classifier -> motor loop be benchmarked end to end.
+    """
+
+    name = "sim"
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.virtual_now = 0.0
+        self.levels = {}
+        self.edges = []
+
+    def now(self):
+        return time.perf_counter() if self.realtime else self.virtual_now
+
+    def _edge(self, timestamp, pin, value):
+        value = 1 if value else 0
+        if self.levels.get(pin) != value:
+            self.edges.append((timestamp, pin, value))
+        self.levels[pin] = value
+
+    def setup_output(self, pin):
+        self.levels[pin] = 0
+
+    def write(self, pin, value):
+        self._edge(self.now(), pin, value)
+
+    def pulse_train(self, pin, half_periods):
+        start = timestamp = self.now()
+        for delay in half_periods:
+            self._edge(timestamp, pin, 1)
+            timestamp += delay
+            self._edge(timestamp, pin, 0)
+            timestamp += delay
+        self.sleep(timestamp - start)
+
+    def sleep(self, seconds):
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            self.virtual_now += seconds
+
+    def cleanup(self):
+        self.levels.clear()
+
+    def pulses(self, pin):
+        """Times of the rising edges on pin"""
+        return [t for t, p, value in self.edges if p == pin and value == 1]
+
+    def step_intervals(self, pin):
+        """Time between consecutive rising edges on pin, i.e. the period of each step"""
+        rises = self.pulses(pin)
+        return [b - a for a, b in zip(rises, rises[1:])]
+
+_default = None
+
+def create_backend(name="auto"):
+    """Create a backend by name: "pigpio", "rpi", "sim", "sim-realtime" or "auto" (pigpio, else RPi.GPIO)"""
+    if name == "pigpio":
+        return PigpioBackend()
+    if name == "rpi":
+        return RPiGPIOBackend()
+    if name == "sim":
+        return SimulatedPins()
+    if name == "sim-realtime":
+        return SimulatedPins(realtime=True)
+    if name == "auto":
+        try:
+            return PigpioBackend()
+        except (ImportError, RuntimeError):
+            return RPiGPIOBackend()
+    raise ValueError(f"Unknown pin backend '{name}'")
+
+def default_backend():
+    """Process-wide backend shared by all motors, created on first use"""
+    global _default
+    if _default is None:
+        _default = create_backend()
+    return _default
@@ -0,0 +1,208 @@
+import itertools
+import threading
+import time
+from queue import Queue, Empty
+import numpy as np
+from preprocess import Preprocessor
+import metrics
+
+class PipelineItem:
+    """One item travelling through the pipeline"""
+
+    def __init__(self, item_id, lease, lane=None):
+        self.id = item_id
+        self.lease = lease  # FrameLease of the captured frame; released after dispatch unless taken
+        self.lane = lane  # Source lane when several cameras share one pipeline
+        self.tensor = None
+        self.class_id = None
+        self.confidence = None
+        self.label = None
+        self.cache_key = None
+        self.cached = False  # Result came from the perceptual cache, inference was skipped
+        self.times = {"captured": time.perf_counter()}
+
+class Stage:
+    """A worker thread that pulls items from a bounded queue, processes them and passes them on"""
+
+    def __init__(self, name, process, queue_size=4, batch_size=1, discard=None):
+        self.name = name
+        self.process = process  # process(list_of_items) handles a batch in place
+        self.discard = discard  # discard(item) frees an item's resources when processing fails
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.next_stage = None
+        self.running = False
+        self.processed = 0
+        self.busy_time = 0.0
+        self.errors = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._work_loop, name=f"pipeline-{self.name}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, item, timeout=None):
+        self.queue.put(item, timeout=timeout)
+
+    def _work_loop(self):
+        while self.running:
+            try:
+                items = [self.queue.get(timeout=0.5)]
+            except Empty:
+                continue
+            # 佇列中已有的項目一起處理（推論階段可批次執行）
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            start = time.perf_counter()
+            try:
+                self.process(items)
+            except Exception as e:
+                self.errors += len(items)
+                print(f"Pipeline stage {self.name} failed: {e}")
+                if self.discard is not None:
+                    for item in items:
+                        self.discard(item)
+                continue
+            finished = time.perf_counter()
+            self.busy_time += finished - start
+            self.processed += len(items)
+            for item in items:
+                item.times[self.name] = finished
+                # 以 stage_ 為前綴：整批處理時間與 ONNXClassifier 的單張 preprocess/session_run 分開統計
+                metrics.observe(f"stage_{self.name}", finished - start, item.id, start)
+                if self.next_stage is not None:
+                    self.next_stage.put(item)
+
+    def stats(self, elapsed):
+        return {
+            "processed": self.processed,
+            "items_per_sec": self.processed / elapsed if elapsed else 0.0,
+            "busy_ms_per_item": self.busy_time / self.processed * 1000 if self.processed else 0.0,
+            "queue_depth": self.queue.qsize(),
+            "errors": self.errors,
+        }
+
+    def stop(self):
+        self.running = False
+        if hasattr(self, "thread"):
+            self.thread.join()
+
+class SortingPipeline:
+    """Capture -> preprocess -> inference -> dispatch -> actuation, one worker per stage.
+
+    Stages are connected by bounded queues, so item N+1 is preprocessed and
+    classified while item N is still being sent or its chute is still moving, and
+    a slow stage applies back-pressure to submit() instead of letting work pile up.
+    dispatch(item) sends the decision (e.g. through a SorterConnection) and may take
+    ownership of item.lease by setting it to None; actuate(item), if given, drives a
+    local motor. Both run on their own stage threads. With a result_cache
+    (phash_cache.PerceptualCache) near-duplicate frames skip preprocessing and inference.
+    Several cameras can feed one pipeline by tagging submissions with a lane; the
+    inference stage then batches frames across lanes.
+    """
+
+    def __init__(self, classifier, dispatch, actuate=None, queue_size=4, max_batch=4, result_cache=None):
+        self.classifier = classifier
+        self.result_cache = result_cache
+        self.preprocessor = Preprocessor()
+        self._ids = itertools.count(1)
+        # 預先配置的輸入張量池，於推論後歸還
+        self.tensor_pool = Queue()
+        for _ in range(queue_size * 2 + max_batch + 2):
+            self.tensor_pool.put(np.empty((3, self.preprocessor.height, self.preprocessor.width), dtype=np.float32))
+        self.batch_buffer = np.empty((max_batch, 3, self.preprocessor.height, self.preprocessor.width),
+                                     dtype=np.float32)
+        self.dispatch = dispatch
+        self.actuate = actuate
+
+        self.stages = [
+            Stage("preprocess", self._preprocess, queue_size, discard=self._discard),
+            Stage("infer", self._infer, queue_size, batch_size=max_batch, discard=self._discard),
+            Stage("dispatch", self._dispatch, queue_size, discard=self._discard),
+        ]
+        if actuate is not None:
+            self.stages.append(Stage("actuate", self._actuate, queue_size))
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        self.submitted = 0
+        self.started_at = None
+
+    def start(self):
+        """Start all stage workers"""
+        self.started_at = time.monotonic()
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, lease, timeout=None, lane=None):
+        """Hand a captured FrameLease to the pipeline; blocks while the first queue is full"""
+        item = PipelineItem(next(self._ids), lease, lane)
+        self.stages[0].put(item, timeout=timeout)
+        self.submitted += 1
+        return item.id
+
+    def _discard(self, item):
+        if item.tensor is not None:
+            self.tensor_pool.put(item.tensor)
+            item.tensor = None
+        if item.lease is not None:
+            item.lease.release()
+            item.lease = None
+
+    def _preprocess(self, items):
+        for item in items:
+            if self.result_cache is not None:
+                item.cache_key = self.result_cache.key(item.lease.frame)
+                result = self.result_cache.get(item.cache_key)
+                if result is not None:
+                    item.class_id, item.confidence = result
+                    item.label = self.classifier.label(item.class_id)
+                    item.cached = True
+                    continue
+            item.tensor = self.tensor_pool.get()
+            self.preprocessor.preprocess_into(item.lease.frame, item.tensor)
+
+    def _infer(self, items):
+        items = [item for item in items if not item.cached]
+        if not items:
+            return
+        batch = self.batch_buffer[:len(items)]
+        np.stack([item.tensor for item in items], out=batch)
+        for item in items:
+            self.tensor_pool.put(item.tensor)
+            item.tensor = None
+        scores = self.classifier.scores_from_tensor(batch)
+        for item, item_scores in zip(items, scores):
+            item.class_id = int(np.argmax(item_scores))
+            item.confidence = float(item_scores[item.class_id])
+            item.label = self.classifier.label(item.class_id)
+            if self.result_cache is not None:
+                self.result_cache.put(item.cache_key, (item.class_id, item.confidence))
+
+    def _dispatch(self, items):
+        for item in items:
+            self.dispatch(item)
+            metrics.observe("capture_to_dispatch", time.perf_counter() - item.times["captured"], item.id)
+            if item.lease is not None:
+                item.lease.release()
+                item.lease = None
+
+    def _actuate(self, items):
+        for item in items:
+            self.actuate(item)
+
+    def stats(self):
+        """Per-stage throughput, busy time and queue depth"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        stats = {"submitted": self.submitted}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats(elapsed)
+        return stats
+
+    def stop(self):
+        """Stop all stage workers"""
+        for stage in self.stages:
+            stage.stop()
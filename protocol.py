@@ -0,0 +1,98 @@
+"""Length-prefixed binary wire protocol shared by the camera clients and the sorter server.
+
+Every frame on the wire is
+
+    uint32 length | header | payload
+
+where length counts the header plus payload and the header is packed as
+network-order (version, msg_type, request_id, class_id, confidence, timestamp).
+The payload carries optional UTF-8 text, e.g. the lane name of a HELLO or the
+JSON body of a STATS_REPLY. Request IDs let a client pipeline many CLASSIFY
+messages and match each ACK to its request.
+"""
+import struct
+import time
+from collections import namedtuple
+
+VERSION = 1
+
+HELLO = 1        # payload: lane name, request_id: client session token (0 for none)
+CLASSIFY = 2     # class_id, confidence, timestamp of the decision
+ACK = 3          # request_id/class_id of the acknowledged CLASSIFY
+STATS = 4        # request server statistics
+STATS_REPLY = 5  # payload: JSON statistics
+TEXT = 6         # payload: free-form message for display
+ERROR = 7        # payload: error description
+
+LENGTH = struct.Struct("!I")
+HEADER = struct.Struct("!BBIhfd")
+MAX_FRAME = 64 * 1024
+
+Message = namedtuple("Message", "msg_type request_id class_id confidence timestamp payload",
+                     defaults=(0, -1, 0.0, 0.0, b""))
+
+class ProtocolError(Exception):
+    pass
+
+def encode(msg_type, request_id=0, class_id=-1, confidence=0.0, timestamp=None, payload=b""):
+    """Encode one message into a complete frame"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if timestamp is None:
+        timestamp = time.time()
+    header = HEADER.pack(VERSION, msg_type, request_id & 0xFFFFFFFF, class_id, confidence, timestamp)
+    return LENGTH.pack(len(header) + len(payload)) + header + payload
+
+def encode_message(message):
+    return encode(*message)
+
+def decode_body(body):
+    """Decode the header and payload of one frame (without its length prefix)"""
+    if len(body) < HEADER.size:
+        raise ProtocolError(f"Frame too short: {len(body)} bytes")
+    version, msg_type, request_id, class_id, confidence, timestamp = HEADER.unpack_from(body)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    return Message(msg_type, request_id, class_id, confidence, timestamp, bytes(body[HEADER.size:]))
+
+class Decoder:
+    """Incremental decoder for blocking sockets: feed() received bytes, get back complete messages"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        offset = 0
+        while len(self.buffer) - offset >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME:
+                raise ProtocolError(f"Frame of {length} bytes exceeds limit")
+            end = offset + LENGTH.size + length
+            if len(self.buffer) < end:
+                break
+            messages.append(decode_body(self.buffer[offset + LENGTH.size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return messages
+
+async def read_message(reader):
+    """Read one message from an asyncio StreamReader; returns None on a clean EOF"""
+    try:
+        prefix = await reader.readexactly(LENGTH.size)
+    except EOFError:
+        return None
+    (length,) = LENGTH.unpack(prefix)
+    if length > MAX_FRAME:
+        raise ProtocolError(f"Frame of {length} bytes exceeds limit")
+    return decode_body(await reader.readexactly(length))
+
+def describe(message):
+    """Human-readable one-line summary of a message, for logs and the web UI"""
+    if message.msg_type == ACK:
+        return f"Server received #{message.request_id}: bin {message.class_id + 1}"
+    if message.msg_type in (TEXT, ERROR, STATS_REPLY):
+        return message.payload.decode('utf-8', errors='replace')
+    return f"Message type {message.msg_type} #{message.request_id}"
@@ -0,0 +1,102 @@
+import argparse
+import os
+import numpy as np
+import onnx
+from PIL import Image
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from preprocess import Preprocessor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def split_images(root="training_image", holdout_every=5):
+    """Split an ImageFolder-style directory into (calibration, holdout) lists of (path, class_index).
+
+    Classes are indexed in sorted folder order, like torchvision's ImageFolder, and
+    every holdout_every-th image of each class is held out for evaluation.
+    """
+    calibration, holdout = [], []
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    for class_index, class_name in enumerate(classes):
+        class_dir = os.path.join(root, class_name)
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for i, filename in enumerate(files):
+            target = holdout if i % holdout_every == holdout_every - 1 else calibration
+            target.append((os.path.join(class_dir, filename), class_index))
+    return calibration, holdout
+
+def load_rgb(path):
+    return np.asarray(Image.open(path).convert("RGB"))
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Feed preprocessed calibration images to onnxruntime's static quantizer one at a time"""
+
+    def __init__(self, image_paths, input_name="input"):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.preprocessor = Preprocessor()
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.image_paths):
+            return None
+        image = load_rgb(self.image_paths[self.index])
+        self.index += 1
+        # 校正器會保留輸入，因此不能直接交出共用緩衝區
+        return {self.input_name: self.preprocessor.preprocess(image, bgr=False).copy()}
+
+    def rewind(self):
+        self.index = 0
+
+def quantize_int8(model_path, output_path, calibration_images, per_channel=True,
+                  calibrate_method="minmax"):
+    """Write a statically quantized INT8 (QDQ) copy of model_path calibrated on calibration_images"""
+    input_name = onnx.load(model_path, load_external_data=False).graph.input[0].name
+    prepared_path = output_path + ".prep.onnx"
+    methods = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+               "percentile": CalibrationMethod.Percentile}
+    try:
+        # 先做形狀推論與圖最佳化，量化結果較穩定。batch 維度是動態的，但 ResNet18 只有 Conv、Pool、
+        # Flatten、Gemm 這類算子，ONNX 內建的形狀推論就能把 batch 符號傳到輸出，不需符號推論
+        quant_pre_process(model_path, prepared_path, skip_symbolic_shape=True)
+        quantize_static(
+            prepared_path,
+            output_path,
+            ImageCalibrationReader(calibration_images, input_name),
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=methods[calibrate_method],
+        )
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+    print(f"INT8 model saved to {output_path}")
+
+def convert_fp16(model_path, output_path):
+    """Write an FP16 copy of model_path that still takes and returns float32 tensors"""
+    try:
+        from onnxconverter_common import float16
+    except ImportError:
+        raise ImportError("FP16 conversion requires the onnxconverter-common package")
+    model = onnx.load(model_path)
+    # keep_io_types 讓 ONNXClassifier 不必改變輸入型別
+    onnx.save(float16.convert_float_to_float16(model, keep_io_types=True), output_path)
+    print(f"FP16 model saved to {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build INT8 and FP16 variants of an FP32 ONNX model")
+    parser.add_argument("--model", default="model.onnx")
+    parser.add_argument("--images", default="training_image")
+    parser.add_argument("--calibrate-method", default="minmax", choices=["minmax", "entropy", "percentile"])
+    parser.add_argument("--skip-fp16", action="store_true")
+    args = parser.parse_args()
+
+    stem = os.path.splitext(args.model)[0]
+    calibration, _ = split_images(args.images)
+    quantize_int8(args.model, f"{stem}.int8.onnx", [path for path, _ in calibration],
+                  calibrate_method=args.calibrate_method)
+    if not args.skip_fp16:
+        convert_fp16(args.model, f"{stem}.fp16.onnx")
@@ -1,46 +1,216 @@
-import socket
+import asyncio
+import json
+import sys
 import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import protocol
+import metrics
+from gpio import StepperMotor
+from pins import create_backend
 
-HOST = "0.0.0.0"  
-PORT = 65432 
+HOST = "0.0.0.0"
+PORT = 65432
 
-def handle_client(conn, addr):
-    """Handle an individual client connection."""
-    print(f"New connection from {addr}")
-    try:
+DEFAULT_LANE = "default"
+
+def log_actuator(lane, bin_number):
+    """Default actuator: just report where the item would go"""
+    print(f"[{lane}] Sorting item into bin {bin_number}")
+
+class StepperActuator:
+    """Actuator that turns the lane's StepperMotor to the item's bin.
+
+    motors maps lane names to motors; lanes without their own motor use the
+    DEFAULT_LANE entry. A motor shared by several lanes is driven by one lane at a time.
+    """
+
+    def __init__(self, motors):
+        self.motors = motors
+        self.locks = {id(motor): threading.Lock() for motor in motors.values()}
+
+    def __call__(self, lane, bin_number):
+        motor = self.motors.get(lane) or self.motors[DEFAULT_LANE]
+        with self.locks[id(motor)]:
+            motor.move_to_bin(bin_number - 1)
+
+class SorterServer:
+    """Asyncio sorter control server.
+
+    Clients speak the framed protocol in protocol.py: HELLO names the lane (sorter
+    unit) the connection feeds and the client's session token, CLASSIFY carries a class ID that is sorted into bin
+    class_id + 1 and is acknowledged with an ACK carrying the same request ID, and
+    STATS returns server statistics. Each lane has its own actuator queue drained
+    by a single worker, so items of one lane are actuated strictly in arrival order
+    while lanes run in parallel. actuator(lane, bin_number) may block; it runs in a
+    worker thread.
+
+    Duplicate CLASSIFY messages are detected per client session, so a client that
+    re-sends unacknowledged requests after a reconnect is not actuated twice, while
+    other clients on the same lane may use the same request IDs.
+    """
+
+    def __init__(self, host=HOST, port=PORT, actuator=log_actuator, stats_interval=30.0, verbose=True,
+                 actuator_threads=32):
+        self.host = host
+        self.port = port
+        self.actuator = actuator
+        # 每個 lane 同時只會佔用一個執行緒，此上限決定可同時動作的 lane 數
+        self.executor = ThreadPoolExecutor(max_workers=actuator_threads)
+        self.stats_interval = stats_interval
+        self.verbose = verbose
+        self.lanes = {}
+        self.lane_workers = {}
+        self.connections = 0
+        self.total_connections = 0
+        self.messages = 0
+        self.actuated = {}
+        self.duplicates = 0
+        self.recent_ids = OrderedDict()  # session -> (deque, set) of recently seen request IDs
+        self.max_sessions = 1024
+        self.started_at = time.monotonic()
+
+    def is_duplicate(self, session, request_id):
+        """Remember request_id for the session; True if it was already seen (a client re-send after reconnect)"""
+        if not session:
+            return False  # 沒有 session 的連線無法重送，不做去重
+        entry = self.recent_ids.get(session)
+        if entry is None:
+            entry = self.recent_ids[session] = (deque(), set())
+            if len(self.recent_ids) > self.max_sessions:
+                self.recent_ids.popitem(last=False)
+        else:
+            self.recent_ids.move_to_end(session)
+        order, seen = entry
+        if request_id in seen:
+            return True
+        order.append(request_id)
+        seen.add(request_id)
+        if len(order) > 4096:
+            seen.discard(order.popleft())
+        return False
+
+    def lane_queue(self, lane):
+        queue = self.lanes.get(lane)
+        if queue is None:
+            queue = self.lanes[lane] = asyncio.Queue()
+            self.actuated[lane] = 0
+            self.lane_workers[lane] = asyncio.create_task(self._lane_worker(lane, queue))
+        return queue
+
+    async def _lane_worker(self, lane, queue):
+        loop = asyncio.get_running_loop()
         while True:
-            data = conn.recv(1024)
-            if not data:
-                break
-                
-            message = data.decode('utf-8')
-            print(f"Received from {addr}: {message}")
-            
-            conn.sendall(f"Server received: {message}".encode('utf-8'))
-    except Exception as e:
-        print(f"Error with client {addr}: {e}")
-    finally:
-        conn.close()
-        print(f"Connection with {addr} closed")
+            request_id, bin_number, queued_at = await queue.get()
+            metrics.observe("server_queue", time.perf_counter() - queued_at, request_id)
+            try:
+                with metrics.span("actuate", request_id):
+                    await loop.run_in_executor(self.executor, self.actuator, lane, bin_number)
+                self.actuated[lane] += 1
+            except Exception as e:
+                print(f"Actuator error on lane {lane}: {e}")
+            finally:
+                queue.task_done()
 
-def start_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen()
-        print(f"Server listening on {HOST}:{PORT}")
-        
+    def stats(self):
+        """Connection, throughput and per-lane queue statistics"""
+        uptime = time.monotonic() - self.started_at
+        return {
+            "connections": self.connections,
+            "total_connections": self.total_connections,
+            "messages": self.messages,
+            "duplicates": self.duplicates,
+            "messages_per_sec": self.messages / uptime if uptime else 0.0,
+            "lanes": {lane: {"queue_depth": queue.qsize(), "actuated": self.actuated[lane]}
+                      for lane, queue in self.lanes.items()},
+        }
+
+    async def handle_client(self, reader, writer):
+        """Handle an individual client connection."""
+        addr = writer.get_extra_info("peername")
+        lane = DEFAULT_LANE
+        session = 0
+        self.connections += 1
+        self.total_connections += 1
+        if self.verbose:
+            print(f"New connection from {addr}")
         try:
             while True:
-                conn, addr = s.accept()
-                
-                client_thread = threading.Thread(target=handle_client, args=(conn, addr))
-                client_thread.daemon = True
-                client_thread.start()
-        except KeyboardInterrupt:
-            print("Server shutting down...")
+                message = await protocol.read_message(reader)
+                if message is None:
+                    break
+                self.messages += 1
+
+                if message.msg_type == protocol.CLASSIFY:
+                    if self.is_duplicate(session, message.request_id):
+                        self.duplicates += 1
+                        metrics.inc("duplicates")
+                    else:
+                        # 從客戶端做出判斷到伺服器收到（含客戶端佇列與網路；跨機器時受時鐘誤差影響）
+                        metrics.observe("server_receive", max(time.time() - message.timestamp, 0.0),
+                                        message.request_id)
+                        self.lane_queue(lane).put_nowait((message.request_id, message.class_id + 1,
+                                                          time.perf_counter()))
+                    reply = protocol.encode(protocol.ACK, message.request_id, message.class_id,
+                                            message.confidence)
+                elif message.msg_type == protocol.HELLO:
+                    lane = message.payload.decode('utf-8') or DEFAULT_LANE
+                    session = message.request_id
+                    reply = protocol.encode(protocol.TEXT, message.request_id, payload=f"Lane set to {lane}")
+                elif message.msg_type == protocol.STATS:
+                    reply = protocol.encode(protocol.STATS_REPLY, message.request_id,
+                                            payload=json.dumps(self.stats()))
+                else:
+                    reply = protocol.encode(protocol.ERROR, message.request_id,
+                                            payload=f"Unexpected message type {message.msg_type}")
+                writer.write(reply)
+                # 只在寫入緩衝區過高時才會等待，客戶端可連續送出多筆請求
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, protocol.ProtocolError) as e:
+            print(f"Error with client {addr}: {e}")
         finally:
-            s.close()
+            self.connections -= 1
+            writer.close()
+            if self.verbose:
+                print(f"Connection with {addr} closed")
+
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            print(f"Server stats: {json.dumps(self.stats())}")
+            if metrics.enabled:
+                print(metrics.summary())
+
+    async def start(self):
+        """Start listening; returns the asyncio server"""
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                                 reuse_address=True, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.stats_interval:
+            self.stats_task = asyncio.create_task(self._report_stats())
+        print(f"Server listening on {self.host}:{self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+def start_server():
+    if "--metrics" in sys.argv:
+        metrics.enable()
+    actuator = log_actuator
+    if "--pins" in sys.argv:
+        # --pins pigpio|rpi|sim-realtime: drive a stepper motor instead of only logging
+        pins = create_backend(sys.argv[sys.argv.index("--pins") + 1])
+        actuator = StepperActuator({DEFAULT_LANE: StepperMotor(pins=pins)})
+    try:
+        asyncio.run(SorterServer(actuator=actuator).serve_forever())
+    except KeyboardInterrupt:
+        print("Server shutting down...")
+        if metrics.enabled:
+            print(metrics.summary())
 
 if __name__ == "__main__":
     start_server()
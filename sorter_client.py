@@ -0,0 +1,206 @@
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+import protocol
+import metrics
+
+class SorterConnection:
+    """Persistent, auto-reconnecting connection to the sorter server shared by all entry points.
+
+    send_classification() never blocks the caller: decisions go into a bounded
+    outbound queue that a background thread drains whenever the server is
+    reachable. When the queue is full the oldest decision is dropped and counted.
+    Sent messages stay in flight until the server ACKs them and are re-sent after
+    a reconnect; the HELLO of every connection carries the same random session
+    token, so the server can discard duplicates of this client only. Failed connects
+    and dropped connections are retried with jittered exponential backoff, which is
+    reset only once a connection received an ACK or stayed up for stable_after seconds.
+    """
+
+    def __init__(self, host, port, lane=None, max_queue=256, max_inflight=64, on_message=None,
+                 connect_timeout=5.0, backoff_initial=0.5, backoff_max=30.0, stable_after=10.0):
+        self.host = host
+        self.port = port
+        self.lane = lane
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight
+        self.on_message = on_message  # Called from the receive thread with every protocol.Message
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+
+        self.running = False
+        self.connected = False
+        self.sock = None
+        self.outbound = deque()
+        self.inflight = OrderedDict()  # request_id -> (encoded frame, first send time)
+        self.cond = threading.Condition()
+        self.next_request_id = random.getrandbits(31)
+        self.session = random.getrandbits(32) or 1  # 0 表示沒有 session
+
+        self.sent = 0
+        self.acked = 0
+        self.dropped = 0
+        self.resent = 0
+        self.connects = 0
+        self.latencies = deque(maxlen=1000)
+
+    def start(self):
+        """Start the background connection thread"""
+        if not self.running:
+            self.running = True
+            self.io_thread = threading.Thread(target=self._run)
+            self.io_thread.daemon = True
+            self.io_thread.start()
+
+    def send_classification(self, class_id, confidence, timestamp=None):
+        """Queue a classification for the sorter; returns its request ID without waiting for the network"""
+        with self.cond:
+            self.next_request_id = (self.next_request_id + 1) & 0xFFFFFFFF
+            request_id = self.next_request_id
+            frame = protocol.encode(protocol.CLASSIFY, request_id, class_id, confidence, timestamp)
+            if len(self.outbound) >= self.max_queue:
+                self.outbound.popleft()
+                self.dropped += 1
+                metrics.inc("dropped")
+            self.outbound.append((request_id, frame))
+            self.cond.notify_all()
+        return request_id
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(protocol.encode(protocol.HELLO, self.session, payload=self.lane or ""))
+        return sock
+
+    def _wait_backoff(self, delay, reason):
+        """Sleep a jittered delay (cut short by stop()); returns the next, doubled delay"""
+        # 指數退避加上隨機抖動，避免多台裝置同時重連
+        wait = random.uniform(0.5, 1.0) * delay
+        print(f"Sorter connection to {self.host}:{self.port} {reason}, retrying in {wait:.1f}s")
+        with self.cond:
+            self.cond.wait_for(lambda: not self.running, timeout=wait)
+        return min(delay * 2, self.backoff_max)
+
+    def _run(self):
+        delay = self.backoff_initial
+        while self.running:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                delay = self._wait_backoff(delay, f"failed ({e})")
+                continue
+            print(f"Connected to sorter server at {self.host}:{self.port}")
+            connected_at = time.monotonic()
+            with self.cond:
+                self.sock = sock
+                self.connected = True
+                self.connects += 1
+                acked_before = self.acked
+                # 重送尚未收到 ACK 的訊息
+                pending = [frame for frame, _ in self.inflight.values()]
+                self.resent += len(pending)
+            reader = threading.Thread(target=self._receive_loop, args=(sock,))
+            reader.daemon = True
+            reader.start()
+            try:
+                if pending:
+                    sock.sendall(b"".join(pending))
+                self._send_loop(sock)
+            except OSError as e:
+                print(f"Sorter connection lost: {e}")
+            finally:
+                with self.cond:
+                    self.connected = False
+                    self.sock = None
+                    self.cond.notify_all()
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)  # Wakes the receive thread
+                except OSError:
+                    pass
+                sock.close()
+                reader.join()
+            # 伺服器接受連線後立刻關閉（滿載、版本不符）時不能立即重連，否則會變成忙迴圈
+            if time.monotonic() - connected_at >= self.stable_after or self.acked > acked_before:
+                delay = self.backoff_initial
+            if self.running:
+                delay = self._wait_backoff(delay, "closed")
+
+    def _send_loop(self, sock):
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or not self.connected or
+                                   (self.outbound and len(self.inflight) < self.max_inflight))
+                if not self.running or not self.connected:
+                    return
+                batch = []
+                while self.outbound and len(self.inflight) < self.max_inflight:
+                    request_id, frame = self.outbound.popleft()
+                    self.inflight[request_id] = (frame, time.perf_counter())
+                    batch.append(frame)
+            with metrics.span("socket_send"):
+                sock.sendall(b"".join(batch))
+            self.sent += len(batch)
+
+    def _receive_loop(self, sock):
+        decoder = protocol.Decoder()
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    if message.msg_type == protocol.ACK:
+                        with self.cond:
+                            entry = self.inflight.pop(message.request_id, None)
+                            if entry is not None:
+                                self.acked += 1
+                                self.latencies.append(time.perf_counter() - entry[1])
+                                metrics.observe("ack_rtt", self.latencies[-1])
+                            self.cond.notify_all()
+                    if self.on_message:
+                        self.on_message(message)
+        except (OSError, protocol.ProtocolError) as e:
+            if self.running:
+                print(f"Error receiving from sorter server: {e}")
+        finally:
+            with self.cond:
+                self.connected = False
+                self.cond.notify_all()
+
+    def stats(self):
+        """Send counters, queue depths and ACK round-trip latency in milliseconds"""
+        with self.cond:
+            latencies = sorted(self.latencies)
+            stats = {
+                "connected": self.connected,
+                "sent": self.sent,
+                "acked": self.acked,
+                "dropped": self.dropped,
+                "resent": self.resent,
+                "reconnects": max(self.connects - 1, 0),
+                "queue_depth": len(self.outbound),
+                "inflight": len(self.inflight),
+            }
+        if latencies:
+            stats["latency_ms_p50"] = latencies[len(latencies) // 2] * 1000
+            stats["latency_ms_p99"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        return stats
+
+    def stop(self):
+        """Close the connection and stop the background thread"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+            sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if hasattr(self, "io_thread"):
+            self.io_thread.join(timeout=2.0)
@@ -0,0 +1,60 @@
+import os
+import time
+import cv2
+import numpy as np
+from USBCamera import USBCamera
+
+class SyntheticCamera(USBCamera):
+    """Camera stand-in that plays the training images as items dropping into an empty chute.
+
+    Frames alternate between gap_seconds of plain background and hold_seconds of
+    one image from image_root, shuffled across the class folders and paced at fps.
+    Class indices follow the sorted folder names, as in the training data loader.
+    item_log records the true class and first appearance of every item, so
+    benchmarks can score decisions and measure latency from drop to bin.
+    """
+
+    def __init__(self, image_root="training_image", fps=30, hold_seconds=1.0, gap_seconds=0.5,
+                 ring_size=4, seed=0):
+        self.image_root = image_root
+        self.hold_frames = max(1, round(hold_seconds * fps))
+        self.gap_frames = max(1, round(gap_seconds * fps))
+        self.seed = seed
+        super().__init__(camera_index=None, fps=fps, ring_size=ring_size)
+
+    def _open_device(self):
+        self.images = []  # (class index, label, 640x480 BGR frame)
+        labels = sorted(d for d in os.listdir(self.image_root) if os.path.isdir(os.path.join(self.image_root, d)))
+        for class_idx, label in enumerate(labels):
+            folder = os.path.join(self.image_root, label)
+            for name in sorted(os.listdir(folder)):
+                image = cv2.imread(os.path.join(folder, name))
+                if image is None:
+                    continue
+                self.images.append((class_idx, label, cv2.resize(image, (640, 480), interpolation=cv2.INTER_AREA)))
+        if not self.images:
+            raise Exception(f"No images found under {self.image_root}")
+        self.order = np.random.default_rng(self.seed).permutation(len(self.images))
+        self.background = np.full((480, 640, 3), 90, dtype=np.uint8)
+        self.frames_read = 0
+        self.item_log = {}  # item index -> (class index, label, perf_counter of first frame)
+
+    def item_for_seq(self, seq):
+        """Index of the item visible in the frame with this sequence number, or None for background"""
+        item, offset = divmod(seq - 1, self.gap_frames + self.hold_frames)
+        return item if offset >= self.gap_frames else None
+
+    def _read_frame(self, buffer):
+        item, offset = divmod(self.frames_read, self.gap_frames + self.hold_frames)
+        self.frames_read += 1
+        if offset < self.gap_frames:
+            np.copyto(buffer, self.background)
+        else:
+            class_idx, label, image = self.images[self.order[item % len(self.order)]]
+            np.copyto(buffer, image)
+            if item not in self.item_log:
+                self.item_log[item] = (class_idx, label, time.perf_counter())
+        return True, buffer
+
+    def _close_device(self):
+        pass
@@ -0,0 +1,27 @@
+from frame_ring import FrameRing
+
+def fill(ring, seq):
+    index, buffer = ring.acquire_write()
+    if index is not None:
+        buffer[:] = seq
+        ring.publish(index, seq)
+    return index
+
+def test_ring_grows_up_to_max_slots_then_drops():
+    ring = FrameRing(slots=2, shape=(2, 2, 3), max_slots=3)
+    leases = []
+    for seq in range(1, 4):
+        assert fill(ring, seq) is not None
+        leases.append(ring.lease_latest())
+    assert len(ring.buffers) == 3
+
+    assert fill(ring, 4) is None
+    assert fill(ring, 5) is None
+    assert len(ring.buffers) == 3
+    assert ring.dropped == 2
+
+    # 舊的 lease 內容沒有被覆蓋
+    assert [int(lease.frame[0, 0, 0]) for lease in leases] == [1, 2, 3]
+    leases[0].release()
+    assert fill(ring, 6) == 0
+    assert ring.dropped == 2
@@ -0,0 +1,61 @@
+import pytest
+
+from gpio import StepperMotor
+from pins import SimulatedPins
+
+def make_motor(**kwargs):
+    pins = SimulatedPins()
+    # start 100 steps/s, cruise 500 steps/s, 2000 steps/s^2 -> 60 steps to reach cruise speed
+    return StepperMotor(dir_pin=10, step_pin=8, steps_per_revolution=200, num_bins=4, pins=pins, **kwargs), pins
+
+def timed_step(motor, pins, steps):
+    start = pins.now()
+    motor.step(steps)
+    return pins.now() - start
+
+def test_long_move_is_trapezoidal():
+    motor, pins = make_motor()
+    delays = motor.ramp_delays(200)
+    assert delays[0] == pytest.approx(0.5 / 100)
+    assert delays == delays[::-1]
+    ramp = delays[:61]
+    assert all(a > b for a, b in zip(ramp, ramp[1:]))
+    assert delays[60:140] == [pytest.approx(0.5 / 500)] * 80
+
+    # The recorded pulse train follows the profile: one full period per step
+    motor.step(200)
+    intervals = pins.step_intervals(motor.step_pin)
+    assert len(pins.pulses(motor.step_pin)) == 200
+    assert intervals == pytest.approx([2 * d for d in delays[:-1]])
+    assert min(intervals) == pytest.approx(1 / 500)
+
+def test_short_move_is_triangular():
+    motor, _ = make_motor()
+    delays = motor.ramp_delays(50)
+    assert delays == delays[::-1]
+    assert delays[0] == pytest.approx(0.5 / 100)
+    # Never reaches cruise speed; peaks in the middle
+    assert min(delays) > 0.5 / 500
+    assert min(delays) == delays[24] == delays[25]
+    half = delays[:25]
+    assert all(a > b for a, b in zip(half, half[1:]))
+
+def test_settle_delay_only_on_reversal():
+    motor, pins = make_motor()
+    move = motor.move_time(50)
+    assert timed_step(motor, pins, 50) == pytest.approx(move)  # first move: nothing to settle
+    assert timed_step(motor, pins, 50) == pytest.approx(move)  # same direction: no delay
+    assert timed_step(motor, pins, -50) == pytest.approx(move + motor.direction_switch_delay)
+    assert timed_step(motor, pins, -50) == pytest.approx(move)
+    assert timed_step(motor, pins, 50) == pytest.approx(move + motor.direction_switch_delay)
+
+def test_move_to_bin_takes_shorter_way_round():
+    motor, pins = make_motor()
+    assert motor.move_to_bin(3) == -50  # 0 -> 3 of 4 bins: one bin backwards
+    assert motor.position == 150
+    assert pins.levels[motor.dir_pin] == motor.CCW
+    assert motor.move_to_bin(0) == 50  # 3 -> 0 wraps forwards
+    assert motor.position == 0
+    assert motor.move_to_bin(1) == 50
+    assert motor.move_to_bin(1) == 0
+    assert len(pins.pulses(motor.step_pin)) == 150
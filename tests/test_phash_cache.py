@@ -0,0 +1,21 @@
+import numpy as np
+
+from phash_cache import PerceptualCache
+
+def scene(color):
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    frame[150:300, 250:400] = color
+    return frame
+
+def test_only_identical_items_hit():
+    cache = PerceptualCache(roi=(200, 100, 240, 240))
+    cache.put(cache.key(scene((30, 200, 30))), (1, 0.9))
+    assert cache.get(cache.key(scene((30, 200, 30)))) == (1, 0.9)
+    assert cache.get(cache.key(scene((200, 30, 30)))) is None
+
+def test_clear_discards_results_of_earlier_lookups():
+    cache = PerceptualCache()
+    key = cache.key(scene((30, 200, 30)))
+    cache.clear()  # 新物品觸發
+    cache.put(key, (1, 0.9))  # 上一個物品的推論這時才完成
+    assert cache.get(cache.key(scene((30, 200, 30)))) is None
@@ -0,0 +1,8 @@
+from server import SorterServer
+
+def test_duplicates_are_scoped_to_a_session():
+    server = SorterServer(stats_interval=0, verbose=False)
+    assert not server.is_duplicate(1, 7)
+    assert server.is_duplicate(1, 7)  # 同一個客戶端重連後重送
+    assert not server.is_duplicate(2, 7)  # 另一個客戶端用了相同的 request ID
+    assert not server.is_duplicate(0, 7) and not server.is_duplicate(0, 7)  # 沒有 session 不去重
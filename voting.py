@@ -0,0 +1,70 @@
+import numpy as np
+
+class TemporalVoter:
+    """Classify a short burst of consecutive camera frames and combine them by confidence-weighted voting.
+
+    Frames are classified chunk_size at a time in one batched run. Each frame's
+    softmax scores are weighted by that frame's own top probability, so a blurry or
+    mid-drop frame with a flat distribution counts for little. Classification stops
+    early as soon as the combined confidence reaches confidence_threshold.
+    """
+
+    def __init__(self, classifier, max_frames=5, chunk_size=2, confidence_threshold=0.9,
+                 frame_timeout=0.5):
+        self.classifier = classifier
+        self.max_frames = max_frames
+        self.chunk_size = chunk_size
+        self.confidence_threshold = confidence_threshold
+        self.frame_timeout = frame_timeout
+
+    def _next_leases(self, camera, seq, count):
+        leases = []
+        for _ in range(count):
+            lease = camera.lease_frame(seq, timeout=self.frame_timeout)
+            if lease is None:
+                break
+            seq = lease.seq
+            leases.append(lease)
+        return leases, seq
+
+    def classify(self, camera, first_lease=None):
+        """Return (label, confidence, frames_used) for the item currently in view.
+
+        first_lease, if given, is used as the first frame of the burst and is left
+        for the caller to release.
+        """
+        totals = None
+        weight_sum = 0.0
+        frames_used = 0
+        seq = first_lease.seq if first_lease is not None else 0
+        best, confidence = 0, 0.0
+        while frames_used < self.max_frames:
+            count = min(self.chunk_size, self.max_frames - frames_used)
+            frames = []
+            if first_lease is not None and frames_used == 0:
+                frames.append(first_lease.frame)
+                count -= 1
+            leases, seq = self._next_leases(camera, seq, count)
+            frames.extend(lease.frame for lease in leases)
+            if not frames:
+                break
+            try:
+                scores = self.classifier.predict_scores(frames)
+            finally:
+                for lease in leases:
+                    lease.release()
+
+            weights = scores.max(axis=1)
+            chunk_totals = (scores * weights[:, None]).sum(axis=0)
+            totals = chunk_totals if totals is None else totals + chunk_totals
+            weight_sum += float(weights.sum())
+            frames_used += len(frames)
+
+            combined = totals / weight_sum
+            best = int(np.argmax(combined))
+            confidence = float(combined[best])
+            if confidence >= self.confidence_threshold:
+                break
+        if totals is None:
+            return None, 0.0, 0
+        return self.classifier.label(best), confidence, frames_used